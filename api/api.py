@@ -2,15 +2,20 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from core_module.summarizer import DocumentSummarizer
-from flask import Flask, request, jsonify, make_response, send_from_directory
+from flask import Flask, request, jsonify, make_response, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 import hashlib
+import json
 
 
 from werkzeug.utils import secure_filename
 import time
 import subprocess
 from core_module.recommedPapers import SearchPapers
+from core_module.upload_store import get_upload_store, STORE_DIR
+from core_module.embedding_cache import get_embedding_store, dispatcher_stats
+from core_module import result_cache, single_flight, clients, compaction, answer_cache, retrieval_cache
+import core_module.config as config
 from dotenv import load_dotenv
 
 # Add the parent directory to the Python path
@@ -29,15 +34,16 @@ app = Flask(__name__)
 CORS(app, resources={
     r"/*": {
         "origins": ["http://localhost:3000"],
-        "methods": ["GET", "POST", "OPTIONS"],
+        "methods": ["GET", "POST", "DELETE", "OPTIONS"],
         "allow_headers": ["Content-Type", "Accept", "Authorization"],
         "supports_credentials": True
     }
 })
 
 # Increase max content length for file uploads
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
-app.config['UPLOAD_FOLDER'] = 'uploads/report_uploads'
+# Ingestion streams documents in bounded batches, so the cap is only a sanity limit
+app.config['MAX_CONTENT_LENGTH'] = config.MAX_UPLOAD_MB * 1024 * 1024
+app.config['UPLOAD_FOLDER'] = STORE_DIR
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -45,6 +51,10 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 # File upload configuration
 ALLOWED_EXTENSIONS = {'pdf'}
 
+def form_flag(name):
+    # Checkbox-style form fields ("1", "true", "yes", "on")
+    return request.form.get(name, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -207,6 +217,8 @@ def upload_pdf_sum():
 
     file = request.files['file']
     model_name = request.form.get('model', None)  # Get the selected model
+    selection = request.form.get('selection', None)  # "embedding" or "local" section selection
+    use_cache = not form_flag('bypass_cache')  # regenerate instead of returning a cached summary
 
     if file.filename == '':
         return jsonify({"status": "error", "message": "No selected file"}), 400
@@ -215,25 +227,14 @@ def upload_pdf_sum():
         return jsonify({"status": "error", "message": "File must be a PDF"}), 400
 
     try:
-        # Create upload directory if it doesn't exist
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(current_dir)  # Go up 1 level
-        upload_dir = os.path.join(project_root, 'uploads', 'sum_uploads')
-
-        if not os.path.exists(upload_dir):
-            os.makedirs(upload_dir)
-
-        # Secure the filename and save the file
-        filename = secure_filename(file.filename)
-        timestamp = str(int(time.time()))
-        saved_filename = f"{timestamp}_{filename}"
-        file_path = os.path.join(upload_dir, saved_filename)
-
-        file.save(file_path)
+        # Store the upload by content hash (re-uploads reuse the stored copy)
+        upload = get_upload_store().save(file, secure_filename(file.filename), hold=True)
+        saved_filename = upload["filename"]
+        file_path = upload["path"]
 
         try:
             # Initialize the summarizer with the selected model
-            summarizer = DocumentSummarizer(model_name=model_name)
+            summarizer = DocumentSummarizer(model_name=model_name, selection_strategy=selection)
 
             print("\n======= LLM SUMMARIZATION STARTED =======")
             print(f"Summarizing document: {saved_filename}")
@@ -244,7 +245,7 @@ def upload_pdf_sum():
             sys.stdout.flush()
             
             # Get the summary (now yields a complete summary at once)
-            summary_generator = summarizer.summarizer(file_path)
+            summary_generator = summarizer.summarizer(file_path, use_cache)
             summary = next(summary_generator)
             
             # Print summary to console
@@ -262,7 +263,10 @@ def upload_pdf_sum():
                 "message": "File uploaded and summarized",
                 "filename": saved_filename,
                 "path": file_path,
+                "file_hash": upload["file_hash"],
+                "deduplicated": upload["deduplicated"],
                 "summary": summary,
+                "cached": summarizer.last_metadata.get("cached", False),
                 "model_used": model_name if model_name else "default"
             }), 200
 
@@ -273,9 +277,13 @@ def upload_pdf_sum():
                 "message": "File uploaded but error occurred during summarization",
                 "filename": saved_filename,
                 "path": file_path,
+                "file_hash": upload["file_hash"],
                 "error": str(e)
             }), 200
 
+        finally:
+            release_upload(upload)
+
     except Exception as e:
         return jsonify({
             "status": "error", 
@@ -296,6 +304,7 @@ def upload_pdf_qa():
             return jsonify({"status": "error", "message": "No file part"}), 400
 
         file = request.files['file']
+        user_id = request.form.get('user_id', None)  # documents are indexed per user
 
         if file.filename == '':
             return jsonify({"status": "error", "message": "No selected file"}), 400
@@ -305,58 +314,31 @@ def upload_pdf_qa():
 
         # Check file size 
         if request.content_length > app.config['MAX_CONTENT_LENGTH']:
-            return jsonify({"status": "error", "message": "File too large (max 16MB)"}), 413
-
-        # Create upload directory if it doesn't exist
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(current_dir)  # Go up 1 level
-        upload_dir = os.path.join(project_root, 'core_module', 'documents')
-
-        # Ensure the directory exists and is writable
-        try:
-            os.makedirs(upload_dir, exist_ok=True)
-            if not os.access(upload_dir, os.W_OK):
-                return jsonify({
-                    "status": "error",
-                    "message": "Upload directory is not writable"
-                }), 500
-        except Exception as e:
-            return jsonify({
-                "status": "error",
-                "message": f"Failed to create upload directory: {str(e)}"
-            }), 500
-
-        # Secure the filename and save the file
-        filename = secure_filename(file.filename)
-        timestamp = str(int(time.time()))
-        saved_filename = f"{timestamp}_{filename}"
-        file_path = os.path.join(upload_dir, saved_filename)
+            return jsonify({"status": "error", "message": f"File too large (max {config.MAX_UPLOAD_MB}MB)"}), 413
 
+        # Store the upload by content hash (re-uploads reuse the stored copy)
         try:
-            file.save(file_path)
+            upload = get_upload_store().save(file, secure_filename(file.filename), hold=True)
         except Exception as e:
             return jsonify({
                 "status": "error",
                 "message": f"Failed to save file: {str(e)}"
             }), 500
+        saved_filename = upload["filename"]
+        file_path = upload["path"]
+        indexed = False
     
         try:
-            from core_module.qa_model import QAModel
+            from core_module.qa_model import get_qa_service
             
-            # Initialize the QA model
-            qa_model = QAModel()
+            # Shared QA service (the vector store is opened once per process)
+            qa_model = get_qa_service(user_id=user_id)
 
             # Process the document and store in vector db
             result = qa_model.process_uploaded_file(file_path)
+            indexed = result is not None
             
             if result is None:
-                # Clean up the uploaded file if processing fails
-                if os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                    except:
-                        pass
-                        
                 return jsonify({
                     "status": "error",
                     "message": "Document appears to be empty or unreadable"
@@ -365,22 +347,21 @@ def upload_pdf_qa():
             return jsonify({
                 "status": "success",
                 "message": "Document processed successfully and ready for questions",
-                "filename": saved_filename
+                "filename": saved_filename,
+                "file_hash": upload["file_hash"],
+                "document_id": upload["file_hash"]
             }), 200
 
         except Exception as e:
-            # Clean up the uploaded file if processing fails
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except:
-                    pass
-            
             return jsonify({
                 "status": "error",
                 "message": f"Error processing document: {str(e)}"
             }), 500
 
+        finally:
+            # Clean up the uploaded file if processing fails
+            release_upload(upload, discard=not indexed)
+
     except Exception as e:
         return jsonify({
             "status": "error",
@@ -390,15 +371,16 @@ def upload_pdf_qa():
 @app.route('/check-documents', methods=['GET'])
 def check_documents():
     try:
-        from core_module.qa_model import QAModel
+        from core_module.qa_model import get_qa_service
         
-        # Initialize the QA model and check for documents
-        qa_model = QAModel()
+        # Shared QA service (the vector store is opened once per process)
+        qa_model = get_qa_service(user_id=request.args.get('user_id'))
         has_docs = qa_model.has_documents()
         
         return jsonify({
             "status": "success",
-            "has_documents": has_docs
+            "has_documents": has_docs,
+            "documents": qa_model.list_documents()
         }), 200
         
     except Exception as e:
@@ -407,19 +389,50 @@ def check_documents():
             "message": f"Error checking documents: {str(e)}"
         }), 500
 
+@app.route('/api/documents/<document_id>', methods=['DELETE'])
+def delete_document(document_id):
+    try:
+        from core_module.qa_model import get_qa_service, is_document_referenced
+
+        qa_model = get_qa_service(user_id=request.args.get('user_id'))
+        if not qa_model.delete_document(document_id):
+            return jsonify({"status": "error", "message": "Document not found"}), 404
+
+        # The stored PDF is content-addressed and may be shared with other
+        # users' collections, requests still reading it or summary and report
+        # generations in flight; it is removed once none of those remain
+        file_removed = get_upload_store().discard_unreferenced(document_id, is_document_referenced)
+
+        return jsonify({
+            "status": "success",
+            "message": "Document deleted",
+            "document_id": document_id,
+            "file_removed": file_removed
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Error deleting document: {str(e)}"
+        }), 500
+
 @app.route('/api/questions/ask', methods=['POST'])
 def ask_question():
     data = request.json
     question = data.get('question')
+    user_id = data.get('user_id')
+    document_ids = data.get('document_ids')  # optional: only search these documents
+    mode = data.get('mode')  # optional retrieval mode: "dense", "hybrid" or "fast"
+    bypass_cache = bool(data.get('bypass_cache'))  # skip the semantic answer cache
 
     if not question:
         return jsonify({"status": "error", "message": "No question provided"}), 400
 
     try:
-        from core_module.qa_model import QAModel
+        from core_module.qa_model import get_qa_service
         
-        # Initialize the QA model
-        qa_model = QAModel()
+        # Shared QA service (the vector store is opened once per process)
+        qa_model = get_qa_service(user_id=user_id)
         
         # Check if documents exist
         if not qa_model.has_documents():
@@ -429,7 +442,7 @@ def ask_question():
             }), 400
             
         # Get answer from the model
-        answer = qa_model.answer_question(question)
+        answer = qa_model.answer_question(question, document_ids, mode, use_cache=not bypass_cache)
         
         return jsonify({
             "status": "success",
@@ -443,6 +456,69 @@ def ask_question():
             "error": str(e)
         }), 500
 
+@app.route('/api/questions/ask-batch', methods=['POST'])
+def ask_questions_batch():
+    data = request.json or {}
+    questions = data.get('questions')
+    user_id = data.get('user_id')
+    document_ids = data.get('document_ids')  # optional: only search these documents
+    mode = data.get('mode')  # optional retrieval mode: "dense", "hybrid" or "fast"
+    bypass_cache = bool(data.get('bypass_cache'))  # skip the semantic answer cache
+    stream = bool(data.get('stream'))  # send answers as Server-Sent Events as they finish
+
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q.strip() for q in questions):
+        return jsonify({"status": "error", "message": "questions must be a non-empty list of questions"}), 400
+    if len(questions) > config.QA_BATCH_MAX_QUESTIONS:
+        return jsonify({
+            "status": "error",
+            "message": f"Too many questions (max {config.QA_BATCH_MAX_QUESTIONS})"
+        }), 400
+
+    try:
+        from core_module.qa_model import get_qa_service
+
+        # Shared QA service (the vector store is opened once per process)
+        qa_model = get_qa_service(user_id=user_id)
+
+        if not qa_model.has_documents():
+            return jsonify({
+                "status": "error",
+                "message": "No documents found. Please upload PDF documents first."
+            }), 400
+
+        results = qa_model.answer_questions(questions, document_ids, mode, use_cache=not bypass_cache)
+
+        if stream:
+            def events():
+                start = time.perf_counter()
+                try:
+                    for position, answer in results:
+                        yield sse_event("answer", {"index": position, "question": questions[position], "answer": answer})
+                    yield sse_event("done", {"count": len(questions), "elapsed": round(time.perf_counter() - start, 3)})
+                except Exception as e:
+                    print(f"Error during streaming: {str(e)}")
+                    yield sse_event("error", {"message": str(e)})
+
+            response = Response(stream_with_context(events()), mimetype='text/event-stream')
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
+
+        answers = [None] * len(questions)
+        for position, answer in results:
+            answers[position] = answer
+        return jsonify({
+            "status": "success",
+            "answers": [{"question": q, "answer": a} for q, a in zip(questions, answers)]
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": "Error processing questions",
+            "error": str(e)
+        }), 500
+
 
 @app.route('/recommend-papers', methods=['POST'])
 def get_recommendations():
@@ -502,6 +578,8 @@ def upload_pdf_report():
         filename = request.form.get('filename', '')
         num_pages = request.form.get('numPages', '3')
         model_name = request.form.get('model', None)  # Get the selected model
+        selection = request.form.get('selection', None)  # "embedding" or "local" section selection
+        use_cache = not form_flag('bypass_cache')  # regenerate instead of returning a cached report
         
         if file.filename == '':
             return jsonify({"status": "error", "message": "No selected file"}), 400
@@ -516,21 +594,18 @@ def upload_pdf_report():
         except ValueError:
             num_pages = 3
 
-        # Create a unique filename
-        timestamp = str(int(time.time()))
-        saved_filename = f"{timestamp}_{secure_filename(filename or file.filename)}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], saved_filename)
-
-        # Save the file
-        file.save(file_path)
-        print(f"File saved to: {file_path}")  # Debug log
+        # Store the upload by content hash (re-uploads reuse the stored copy)
+        upload = get_upload_store().save(file, secure_filename(filename or file.filename), hold=True)
+        saved_filename = upload["filename"]
+        file_path = upload["path"]
+        print(f"File stored at: {file_path} (deduplicated: {upload['deduplicated']})")  # Debug log
 
         # Generate the report
         try:
             from core_module.report_generator import ReportGenerator
             
             # Initialize the report generator with the selected model
-            reportGenerator = ReportGenerator(model_name=model_name)
+            reportGenerator = ReportGenerator(model_name=model_name, selection_strategy=selection)
 
             print("\n======= LLM REPORT GENERATION STARTED =======")
             print(f"Generating report for: {saved_filename}")
@@ -542,7 +617,7 @@ def upload_pdf_report():
             
             # Collect all chunks and print to console in real-time
             all_chunks = []
-            for chunk in reportGenerator.generate_report(file_path):
+            for chunk in reportGenerator.generate_report(file_path, use_cache):
                 all_chunks.append(chunk)
                 # Print to terminal with flush to show real-time progress
                 sys.stdout.write(chunk)
@@ -562,7 +637,10 @@ def upload_pdf_report():
                 "message": "File uploaded and report generated",
                 "filename": saved_filename,
                 "path": file_path,
+                "file_hash": upload["file_hash"],
+                "deduplicated": upload["deduplicated"],
                 "report": report,
+                "cached": reportGenerator.last_metadata.get("cached", False),
                 "model_used": model_name if model_name else "default"
             }), 200
 
@@ -573,9 +651,13 @@ def upload_pdf_report():
                 "message": "File uploaded but error occurred during report generation",
                 "filename": saved_filename,
                 "path": file_path,
+                "file_hash": upload["file_hash"],
                 "error": str(e)
             }), 200
 
+        finally:
+            release_upload(upload)
+
     except Exception as e:
         print(f"Error during upload: {str(e)}")
         return jsonify({
@@ -643,5 +725,136 @@ def change_password():
             "message": f"Error changing password: {str(e)}"
         }), 500
 
+def sse_event(event, data):
+    # One Server-Sent Events frame; data is JSON so newlines in tokens survive
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def release_upload(upload, discard=False):
+    # End the request's hold on a stored upload (see UploadStore.save); with
+    # discard, a new upload that turned out unusable is removed unless another
+    # request or collection needs it
+    store = get_upload_store()
+    store.release(upload["file_hash"])
+    if discard and not upload["deduplicated"]:
+        from core_module.qa_model import is_document_referenced
+        try:
+            store.discard_unreferenced(upload["file_hash"], is_document_referenced)
+        except Exception as e:
+            print(f"Error removing upload {upload['file_hash']}: {str(e)}")
+
+def sse_response(upload, token_stream, generator, model_name):
+    # Forward tokens to the client as the LLM produces them, then a final
+    # "done" event with metadata (or an "error" event)
+    def events():
+        start = time.perf_counter()
+        yield sse_event("start", {
+            "filename": upload["filename"],
+            "file_hash": upload["file_hash"],
+            "deduplicated": upload["deduplicated"],
+        })
+        first_token = None
+        try:
+            for token in token_stream:
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                yield sse_event("token", {"text": token})
+            yield sse_event("done", {
+                **generator.last_metadata,
+                "model_used": model_name if model_name else "default",
+                "time_to_first_token": round(first_token, 3) if first_token is not None else None,
+                "elapsed": round(time.perf_counter() - start, 3),
+            })
+        except Exception as e:
+            print(f"Error during streaming: {str(e)}")
+            yield sse_event("error", {"message": str(e)})
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies (nginx) from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    # The upload is held until the stream ends; by then the generation that
+    # reads it has finished or is registered as an in-flight run
+    response.call_on_close(lambda: release_upload(upload))
+    return response
+
+@app.route('/api/summarize-stream', methods=['POST'])
+def summarize_stream():
+    if 'file' not in request.files:
+        return jsonify({"status": "error", "message": "No file part"}), 400
+
+    file = request.files['file']
+    model_name = request.form.get('model', None)
+    selection = request.form.get('selection', None)
+
+    if file.filename == '':
+        return jsonify({"status": "error", "message": "No selected file"}), 400
+
+    if not allowed_file(file.filename):
+        return jsonify({"status": "error", "message": "File must be a PDF"}), 400
+
+    summarizer = DocumentSummarizer(model_name=model_name, selection_strategy=selection)
+    use_cache = not form_flag('bypass_cache')
+
+    try:
+        upload = get_upload_store().save(file, secure_filename(file.filename), hold=True)
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Error during upload: {str(e)}"
+        }), 500
+
+    return sse_response(upload, summarizer.stream_summary(upload["path"], use_cache), summarizer, model_name)
+
+@app.route('/api/report-stream', methods=['POST'])
+def report_stream():
+    if 'pdf' not in request.files:
+        return jsonify({"status": "error", "message": "No file part"}), 400
+
+    file = request.files['pdf']
+    filename = request.form.get('filename', '')
+    model_name = request.form.get('model', None)
+    selection = request.form.get('selection', None)
+
+    if file.filename == '':
+        return jsonify({"status": "error", "message": "No selected file"}), 400
+
+    if not allowed_file(file.filename):
+        return jsonify({"status": "error", "message": "File must be a PDF"}), 400
+
+    from core_module.report_generator import ReportGenerator
+    reportGenerator = ReportGenerator(model_name=model_name, selection_strategy=selection)
+    use_cache = not form_flag('bypass_cache')
+
+    try:
+        upload = get_upload_store().save(file, secure_filename(filename or file.filename), hold=True)
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Error during upload: {str(e)}"
+        }), 500
+
+    return sse_response(upload, reportGenerator.stream_report(upload["path"], use_cache), reportGenerator, model_name)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    try:
+        return jsonify({
+            "status": "success",
+            "embedding_cache": get_embedding_store().stats(),
+            "embedding_dispatch": dispatcher_stats(),
+            "result_cache": result_cache.stats(),
+            "single_flight": single_flight.stats(),
+            "clients": clients.stats(),
+            "compaction": compaction.stats(),
+            "answer_cache": answer_cache.stats(),
+            "retrieval_cache": retrieval_cache.stats()
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "message": f"Error collecting metrics: {str(e)}"
+        }), 500
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -6,6 +6,9 @@ import ReactMarkdown from 'react-markdown';
 
 const API_BASE_URL = 'http://localhost:5000';
 
+// Documents are indexed per user; the logged-in user is kept in localStorage
+const getUserId = () => JSON.parse(localStorage.getItem('user') || '{}').user_id;
+
 export default function QuestionAnsweringPage() {
   const router = useRouter();
   const [question, setQuestion] = useState('');
@@ -16,6 +19,7 @@ export default function QuestionAnsweringPage() {
   const [uploadStatus, setUploadStatus] = useState<'idle' | 'uploading' | 'success' | 'error'>('idle');
   const [uploadMessage, setUploadMessage] = useState('');
   const [isDocumentReady, setIsDocumentReady] = useState(false);
+  const [documentId, setDocumentId] = useState('');
   const [checkingDocuments, setCheckingDocuments] = useState(true);
 
   // Check for existing documents when the page loads
@@ -67,9 +71,14 @@ export default function QuestionAnsweringPage() {
       setUploadStatus('uploading');
       setUploadMessage('Processing document...');
       setIsDocumentReady(false);
+      setDocumentId('');
 
       const formData = new FormData();
       formData.append('file', selectedFile);
+      const userId = getUserId();
+      if (userId) {
+        formData.append('user_id', userId);
+      }
 
       // Create an AbortController to handle timeouts
       const controller = new AbortController();
@@ -103,6 +112,8 @@ export default function QuestionAnsweringPage() {
         if (data.status === 'success') {
           setUploadStatus('success');
           setUploadMessage('Document processed successfully! You can now ask questions.');
+          // Questions are answered from this document only
+          setDocumentId(data.document_id);
           setIsDocumentReady(true);
         } else {
           setUploadStatus('error');
@@ -149,7 +160,11 @@ export default function QuestionAnsweringPage() {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ question }),
+        body: JSON.stringify({
+          question,
+          user_id: getUserId(),
+          document_ids: documentId ? [documentId] : undefined,
+        }),
       });
 
       const data = await response.json();
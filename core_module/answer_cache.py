@@ -0,0 +1,153 @@
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+import core_module.config as config
+from core_module.retrieval_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class _Scope:
+    """Cached answers for one (collection, model, mode, document filter)."""
+
+    def __init__(self, version):
+        self.version = version
+        self.exact = OrderedDict()  # normalized question -> (answer, latency)
+        self.vectors = None  # (n, d) unit-length query embeddings
+        self.questions = []
+        self.answers = []
+        self.latencies = []
+
+
+class AnswerCache:
+    """
+    In-memory semantic cache of QA answers.
+
+    A question is answered from the cache when its normalized text matches
+    a cached question, or when its embedding is within
+    QA_ANSWER_CACHE_THRESHOLD cosine similarity of one, asked against the
+    same collection, model, retrieval mode and document filter. The text
+    match needs no embedding, so repeats are answered without any API call.
+    Each scope is stamped with the collection's manifest version, so adding
+    or deleting a document invalidates every answer computed before it.
+    """
+
+    def __init__(self, threshold=None, max_entries=None, max_scopes=None):
+        self.threshold = threshold if threshold is not None else config.QA_ANSWER_CACHE_THRESHOLD
+        self.max_entries = max_entries or config.QA_ANSWER_CACHE_MAX_ENTRIES
+        self.max_scopes = max_scopes or config.QA_ANSWER_CACHE_MAX_SCOPES
+        self._scopes = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.exact_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _scope(self, key, version, create=False):
+        scope = self._scopes.get(key)
+        if scope is not None and scope.version != version:
+            # The document set changed since these answers were computed
+            del self._scopes[key]
+            self.invalidations += 1
+            scope = None
+        if scope is None and create:
+            scope = self._scopes[key] = _Scope(version)
+            while len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
+        if scope is not None:
+            self._scopes.move_to_end(key)
+        return scope
+
+    def get(self, key, version, question, query_vector=None):
+        """
+        Return the cached answer for a question, or None.
+
+        Args:
+            key (tuple): Scope of the question (collection, model, mode, document filter)
+            version (int): Current manifest version of the collection
+            question (str): The question; an exact (normalized) match is checked first
+            query_vector (list, optional): Embedding of the question, for the
+                similarity match; without it only exact repeats are found
+        """
+        query = self._unit(query_vector) if query_vector is not None else None
+        with self._lock:
+            scope = self._scope(key, version)
+            if scope is None:
+                self.misses += 1
+                return None
+            exact = scope.exact.get(normalize_query(question))
+            if exact is not None:
+                self.hits += 1
+                self.exact_hits += 1
+                self.saved_seconds += exact[1]
+                return exact[0]
+            if query is None or scope.vectors is None:
+                self.misses += 1
+                return None
+            similarities = scope.vectors @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += scope.latencies[best]
+            logger.info(f"Answer cache hit (similarity {similarities[best]:.3f}) for: {scope.questions[best]}")
+            return scope.answers[best]
+
+    def put(self, key, version, query_vector, question, answer, latency):
+        """Store an answer and the seconds it took to produce; query_vector may be None."""
+        with self._lock:
+            scope = self._scope(key, version, create=True)
+            scope.exact[normalize_query(question)] = (answer, latency)
+            while len(scope.exact) > self.max_entries:
+                scope.exact.popitem(last=False)
+            if query_vector is None:
+                return
+            query = self._unit(query_vector)[None, :]
+            scope.vectors = query if scope.vectors is None else np.vstack([scope.vectors, query])
+            scope.questions.append(question)
+            scope.answers.append(answer)
+            scope.latencies.append(latency)
+            if len(scope.answers) > self.max_entries:
+                # Oldest answers go first
+                drop = len(scope.answers) - self.max_entries
+                scope.vectors = scope.vectors[drop:]
+                del scope.questions[:drop], scope.answers[:drop], scope.latencies[:drop]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "exact_hits": self.exact_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "invalidations": self.invalidations,
+                "scopes": len(self._scopes),
+                "entries": sum(len(scope.exact) for scope in self._scopes.values()),
+            }
+
+
+# Process-wide cache shared by every QA service
+_cache = AnswerCache()
+
+
+def get(key, version, question, query_vector=None):
+    return _cache.get(key, version, question, query_vector)
+
+
+def put(key, version, query_vector, question, answer, latency):
+    _cache.put(key, version, query_vector, question, answer, latency)
+
+
+def stats():
+    return _cache.stats()
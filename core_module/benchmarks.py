@@ -0,0 +1,412 @@
+"""
+Micro-benchmarks for the document pipeline.
+
+Run from the project root, e.g.:
+
+    python -m core_module.benchmarks dispatch 500
+    python -m core_module.benchmarks selection 1000 5000
+    python -m core_module.benchmarks overlap path/to/paper.pdf
+    python -m core_module.benchmarks index 10000 100000
+    python -m core_module.benchmarks mmap 100000 1000000
+    python -m core_module.benchmarks packing path/to/paper.pdf
+    python -m core_module.benchmarks mmr 20 100 500
+"""
+import os
+import sys
+import time
+
+
+# Serial single-batch embedding vs. the adaptive concurrent dispatcher,
+# both against a fake backend with injected latency
+def bench_embedding_dispatch(num_texts=2000, latency=0.2, per_item_latency=0.002, failure_rate=0.02):
+    from core_module.embedding_dispatcher import EmbeddingDispatcher, FakeEmbeddingBackend
+
+    texts = [f"chunk {i} " * 20 for i in range(num_texts)]
+
+    backend = FakeEmbeddingBackend(latency=latency, per_item_latency=per_item_latency)
+    start = time.perf_counter()
+    for i in range(0, num_texts, 100):
+        backend.embed_documents(texts[i:i + 100])
+    serial = time.perf_counter() - start
+
+    backend = FakeEmbeddingBackend(latency=latency, per_item_latency=per_item_latency,
+                                   failure_rate=failure_rate, max_batch_size=100)
+    dispatcher = EmbeddingDispatcher(backend, max_retries=5)
+    start = time.perf_counter()
+    vectors = dispatcher.embed_documents(texts)
+    dispatched = time.perf_counter() - start
+
+    assert vectors == [backend._vector(text) for text in texts]
+    print(f"{num_texts} texts: serial batches of 100 {serial:.2f}s, "
+          f"dispatcher {dispatched:.2f}s ({serial / dispatched:.1f}x) {dispatcher.stats()}")
+
+
+def _clustered_vectors(n, dimensions=768, clusters=10, seed=0):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions))
+    vectors = centers[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dimensions))
+    return vectors.astype(np.float32)
+
+
+# NumPy k-means section selector vs. the EmbeddingsClusteringFilter it replaced,
+# on precomputed (i.e. cached) embedding matrices
+def bench_section_selection(*sizes, num_clusters=10, repeats=3):
+    from core_module.section_selector import select_representatives
+    try:
+        from langchain_community.document_transformers.embeddings_redundant_filter import _filter_cluster_embeddings
+
+        def baseline(vectors):
+            return _filter_cluster_embeddings(vectors.tolist(), num_clusters, 1, 42, False)
+    except ImportError:
+        from sklearn.cluster import KMeans
+
+        def baseline(vectors):
+            return KMeans(n_clusters=num_clusters, random_state=42).fit(vectors).labels_
+
+    for n in [int(size) for size in sizes] or [1000, 5000, 10000]:
+        vectors = _clustered_vectors(n, clusters=num_clusters)
+        timings = {}
+        for name, fn in (("EmbeddingsClusteringFilter", baseline),
+                         ("numpy k-means", lambda v: select_representatives(v, num_clusters))):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                fn(vectors)
+            timings[name] = (time.perf_counter() - start) / repeats
+        base, ours = timings.values()
+        print(f"{n} chunks: filter {base * 1000:.1f}ms, numpy k-means {ours * 1000:.1f}ms ({base / ours:.1f}x)")
+
+
+# Selection overlap between the embedding and local (TF-IDF) strategies on
+# real documents; defaults to every PDF in the upload store
+def bench_selection_overlap(*file_paths):
+    import glob
+    import os
+    import core_module.config as config
+    from core_module import document_cache
+    from core_module.embedding_cache import get_cached_embeddings
+    from core_module.section_selector import compare_strategies, select_sections_local
+    from core_module.upload_store import STORE_DIR
+
+    file_paths = file_paths or sorted(glob.glob(os.path.join(STORE_DIR, "*.pdf")))
+    if not file_paths:
+        print("No documents to compare; pass PDF paths as arguments")
+        return
+    embeddings = get_cached_embeddings(config.EMBED_MODEL)
+
+    for file_path in file_paths:
+        texts = document_cache.load_chunks(file_path, config.CHUNK_SIZE, config.CHUNK_OVERLAP)
+        num_clusters = min(min(max(3, len(texts) // 5), 10), max(2, len(texts) // 2))
+        start = time.perf_counter()
+        select_sections_local(texts, num_clusters)
+        local_time = time.perf_counter() - start
+        result = compare_strategies(texts, embeddings, num_clusters)
+        print(f"{os.path.basename(file_path)}: {len(texts)} chunks, k={num_clusters}, "
+              f"jaccard {result['jaccard']:.2f}, within one chunk {result['near_overlap']:.2f}, "
+              f"local selection {local_time * 1000:.1f}ms")
+
+
+# Load test: N concurrent identical requests with and without single-flight
+# coalescing, against a fake pipeline (extraction + clustering latency, then
+# a token stream)
+def bench_single_flight(num_requests=20, pipeline_latency=0.5, num_tokens=50, token_latency=0.01):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from core_module.single_flight import SingleFlight
+
+    runs = []
+    runs_lock = threading.Lock()
+
+    def pipeline():
+        with runs_lock:
+            runs.append(1)
+        time.sleep(pipeline_latency)
+        for i in range(num_tokens):
+            time.sleep(token_latency)
+            yield f"token{i} "
+
+    expected = "".join(f"token{i} " for i in range(num_tokens))
+    flights = SingleFlight()
+
+    def coalesced(_):
+        flight, _ = flights.join("paper", pipeline)
+        return flight.result()
+
+    for name, request in (("independent", lambda _: "".join(pipeline())), ("single-flight", coalesced)):
+        runs.clear()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=num_requests) as executor:
+            results = list(executor.map(request, range(num_requests)))
+        elapsed = time.perf_counter() - start
+        assert all(result == expected for result in results)
+        print(f"{num_requests} concurrent requests, {name}: {len(runs)} pipeline runs, {elapsed:.2f}s")
+    print(flights.stats())
+
+
+# Recall@k and p50/p99 query latency of the FAISS index types against the
+# Chroma path, on clustered synthetic embeddings
+def bench_vector_index(*sizes, dimensions=768, num_queries=200, k=10):
+    import shutil
+    import tempfile
+    import warnings
+    import chromadb
+    import faiss
+    import numpy as np
+    from langchain_community.vectorstores import Chroma
+    from core_module.vector_index import ChromaIndex, FaissIndex
+    from core_module.vector_manifest import VectorManifest
+
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    sizes = [int(size) for size in sizes] or [10000, 100000, 1000000]
+    for n in sizes:
+        vectors = _clustered_vectors(n + num_queries, dimensions=dimensions, clusters=50)
+        vectors, queries = vectors[:n], vectors[n:]
+        exact = faiss.IndexFlatL2(dimensions)
+        exact.add(vectors)
+        _, truth = exact.search(queries, k)
+
+        ids = [f"doc{i // 100}:{i % 100}" for i in range(n)]
+        metadatas = [{"doc_id": f"doc{i // 100}", "row": i} for i in range(n)]
+        texts = [""] * n
+        directory = tempfile.mkdtemp()
+        try:
+            manifest = VectorManifest(os.path.join(directory, "manifest.json"))
+            backends = {"chroma": lambda: ChromaIndex(Chroma(
+                client=chromadb.PersistentClient(path=os.path.join(directory, "chroma")),
+                collection_name="bench",
+                embedding_function=None
+            ), lambda: manifest)}
+            for index_type in ("flat", "hnsw", "ivfpq"):
+                backends[f"faiss-{index_type}"] = lambda index_type=index_type: FaissIndex(
+                    os.path.join(directory, index_type), index_type)
+
+            for name, make_index in backends.items():
+                index = make_index()
+                start = time.perf_counter()
+                for batch in range(0, n, 5000):
+                    index.add(ids[batch:batch + 5000], vectors[batch:batch + 5000].tolist(),
+                              metadatas[batch:batch + 5000], texts[batch:batch + 5000])
+                index.persist()
+                build = time.perf_counter() - start
+                if name != "chroma":
+                    # Query a fresh, memory-mapped load of the persisted index
+                    index = make_index()
+
+                latencies = []
+                hits = 0
+                for query, expected in zip(queries, truth):
+                    start = time.perf_counter()
+                    found = index.search(query.tolist(), k)
+                    latencies.append(time.perf_counter() - start)
+                    hits += len({doc.metadata["row"] for doc in found} & set(expected.tolist()))
+                latencies = np.asarray(latencies) * 1000
+                print(f"{n} chunks, {name}: recall@{k} {hits / (k * num_queries):.3f}, "
+                      f"p50 {np.percentile(latencies, 50):.2f}ms, p99 {np.percentile(latencies, 99):.2f}ms, "
+                      f"build {build:.1f}s")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+# Memory of a persisted FAISS index once a worker process has loaded it and
+# run a few searches: private (anonymous) memory vs. file-backed pages,
+# which the page cache shares between all workers that map the same file
+_MEMORY_PROBE = """
+import sys, numpy as np
+from core_module.vector_index import FaissIndex
+def rss():
+    fields = dict(line.split(":", 1) for line in open("/proc/self/status"))
+    return int(fields["RssAnon"].split()[0]) // 1024, int(fields["RssFile"].split()[0]) // 1024
+anon, mapped = rss()
+index = FaissIndex(sys.argv[1], sys.argv[2])
+index.search(np.random.default_rng(0).standard_normal(int(sys.argv[3])).tolist(), 10)
+after_anon, after_mapped = rss()
+print(after_anon - anon, after_mapped - mapped, index._mmapped)
+"""
+
+
+def bench_index_memory(*sizes, dimensions=768, index_types=("flat", "hnsw")):
+    import shutil
+    import subprocess
+    import tempfile
+    import faiss
+    import numpy as np
+    from core_module.vector_index import FaissIndex
+
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sizes = [int(size) for size in sizes] or [100000, 1000000]
+    for n in sizes:
+        for index_type in index_types:
+            directory = tempfile.mkdtemp(prefix="bench-mmap-")
+            try:
+                # Write the index file directly; the chunk rows are not needed
+                index = FaissIndex(directory, index_type)
+                raw = index._new_index(dimensions)
+                rng = np.random.default_rng(0)
+                start = time.perf_counter()
+                for batch in range(0, n, 50000):
+                    size = min(50000, n - batch)
+                    raw.add_with_ids(rng.standard_normal((size, dimensions)).astype(np.float32),
+                                     np.arange(batch, batch + size, dtype=np.int64))
+                faiss.write_index(raw, index.index_path)
+                build = time.perf_counter() - start
+                file_mb = os.path.getsize(index.index_path) // (1024 * 1024)
+                del raw, index
+
+                probe = subprocess.run(
+                    [sys.executable, "-c", _MEMORY_PROBE, directory, index_type, str(dimensions)],
+                    capture_output=True, text=True, check=True, cwd=project_root,
+                )
+                anon, mapped, is_mapped = probe.stdout.split()
+                print(f"{n} vectors, faiss-{index_type}: file {file_mb}MB, private +{anon}MB, "
+                      f"shared file-backed +{mapped}MB, memory-mapped {is_mapped}, build {build:.0f}s")
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+
+# Prompt context tokens per question: the raw top-k chunks (what the stuff
+# chain sent before) vs. the packed context, at the same k. Questions are
+# spans drawn from the document, retrieved with BM25 so no API calls are
+# needed; coverage is the share of questions whose span is still in the
+# context, so the savings are compared at equal answer coverage.
+def bench_context_packing(*file_paths, num_questions=50, k=None, seed=0):
+    import glob
+    import random
+    import shutil
+    import tempfile
+    import core_module.config as config
+    from core_module import document_cache
+    from core_module.bm25 import BM25Index
+    from core_module.context_packer import pack_context, estimate_tokens
+    from core_module.upload_store import STORE_DIR, file_sha256
+
+    file_paths = file_paths or sorted(glob.glob(os.path.join(STORE_DIR, "*.pdf")))
+    if not file_paths:
+        print("No documents to pack; pass PDF paths as arguments")
+        return
+    rng = random.Random(seed)
+    k = k or config.QA_CONTEXT_CHUNKS
+
+    def covers(documents, span):
+        return span in " ".join(" ".join(doc.page_content.split()) for doc in documents).lower()
+
+    for file_path in file_paths:
+        doc_id = file_sha256(file_path)
+        chunks = document_cache.load_chunks(file_path, config.QA_CHUNK_SIZE, config.QA_CHUNK_OVERLAP)
+        directory = tempfile.mkdtemp(prefix="bench-packing-")
+        try:
+            index = BM25Index(os.path.join(directory, "bm25.sqlite3"))
+            index.add(
+                [f"{doc_id}:{n}" for n in range(len(chunks))],
+                None,
+                [{**chunk.metadata, "doc_id": doc_id, "chunk": n} for n, chunk in enumerate(chunks)],
+                [chunk.page_content for chunk in chunks],
+            )
+            index.persist()
+
+            raw_tokens = packed_tokens = legacy_tokens = 0
+            raw_covered = packed_covered = 0
+            start = time.perf_counter()
+            for _ in range(num_questions):
+                words = rng.choice(chunks).page_content.split()
+                offset = rng.randrange(max(1, len(words) - 12))
+                span = " ".join(words[offset:offset + 12])
+                documents, _ = index.search(span, k)
+                raw_tokens += estimate_tokens("\n\n".join(doc.page_content for doc in documents))
+                packed = pack_context(documents)
+                packed_tokens += estimate_tokens("\n\n".join(doc.page_content for doc in packed))
+                raw_covered += covers(documents, span.lower())
+                packed_covered += covers(packed, span.lower())
+                # Chunks indexed before start offsets were recorded
+                legacy = [doc.model_copy(update={"metadata": {key: value for key, value in doc.metadata.items()
+                                                              if key != "start_index"}}) for doc in documents]
+                legacy_tokens += estimate_tokens("\n\n".join(doc.page_content for doc in pack_context(legacy)))
+            elapsed = (time.perf_counter() - start) / num_questions
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        print(f"{os.path.basename(file_path)}: {len(chunks)} chunks, {num_questions} questions, k={k}, "
+              f"context tokens/question raw {raw_tokens / num_questions:.0f} "
+              f"(coverage {raw_covered / num_questions:.0%}), "
+              f"packed {packed_tokens / num_questions:.0f} ({1 - packed_tokens / raw_tokens:.0%} fewer, "
+              f"coverage {packed_covered / num_questions:.0%}), "
+              f"packed without offsets {legacy_tokens / num_questions:.0f}, "
+              f"{elapsed * 1000:.2f}ms/question")
+
+
+# MMR re-ranking latency: the vectorized implementation vs. a per-pair
+# Python loop over the same candidates
+def bench_mmr(*fetch_ks, dimensions=768, k=4, lambda_mult=0.5, repeats=20):
+    import numpy as np
+    from core_module.mmr import mmr
+
+    def mmr_loops(query, candidates, k):
+        def cosine(a, b):
+            return sum(x * y for x, y in zip(a, b)) / ((sum(x * x for x in a) * sum(y * y for y in b)) ** 0.5)
+        relevance = [cosine(query, c) for c in candidates]
+        selected = []
+        while len(selected) < min(k, len(candidates)):
+            best, best_score = None, -float("inf")
+            for i, candidate in enumerate(candidates):
+                if i in selected:
+                    continue
+                redundancy = max((cosine(candidate, candidates[j]) for j in selected), default=0.0)
+                score = lambda_mult * relevance[i] - (1 - lambda_mult) * redundancy
+                if score > best_score:
+                    best, best_score = i, score
+            selected.append(best)
+        return selected
+
+    for fetch_k in [int(n) for n in fetch_ks] or [20, 100, 500]:
+        vectors = _clustered_vectors(fetch_k + 1, dimensions)
+        query, candidates = vectors[0], vectors[1:]
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fast = mmr(query, candidates, k, lambda_mult)
+        vectorized = (time.perf_counter() - start) / repeats
+
+        query_list, candidate_list = query.tolist(), candidates.tolist()
+        loop_repeats = max(1, repeats // 10)
+        start = time.perf_counter()
+        for _ in range(loop_repeats):
+            slow = mmr_loops(query_list, candidate_list, k)
+        loops = (time.perf_counter() - start) / loop_repeats
+
+        assert fast == slow
+        print(f"fetch_k={fetch_k}, k={k}: vectorized {vectorized * 1000:.2f}ms, "
+              f"python loops {loops * 1000:.1f}ms ({loops / vectorized:.0f}x)")
+
+
+def _parse_arg(arg):
+    # Command-line arguments are numbers (sizes, counts, latencies) or paths
+    for parse in (int, float):
+        try:
+            return parse(arg)
+        except ValueError:
+            pass
+    return arg
+
+
+BENCHMARKS = {
+    "dispatch": bench_embedding_dispatch,
+    "selection": bench_section_selection,
+    "overlap": bench_selection_overlap,
+    "coalesce": bench_single_flight,
+    "index": bench_vector_index,
+    "mmap": bench_index_memory,
+    "packing": bench_context_packing,
+    "mmr": bench_mmr,
+}
+
+
+if __name__ == "__main__":
+    # "python -m core_module.benchmarks <name> [args...]" runs one benchmark;
+    # with no arguments every benchmark runs with its defaults
+    if len(sys.argv) > 1:
+        runs = [(sys.argv[1], [_parse_arg(arg) for arg in sys.argv[2:]])]
+    else:
+        runs = [(name, []) for name in BENCHMARKS]
+    for name, args in runs:
+        print(f"== {name} ==")
+        BENCHMARKS[name](*args)
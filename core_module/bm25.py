@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import math
+import sqlite3
+import logging
+import threading
+from collections import Counter
+from langchain_core.documents import Document
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+import core_module.config as config
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return [token for token in _TOKEN.findall(text.lower()) if len(token) > 1 and token not in ENGLISH_STOP_WORDS]
+
+
+def chunk_key(document):
+    # Stable identity of a retrieved chunk across retrievers
+    metadata = document.metadata
+    if "doc_id" in metadata and "chunk" in metadata:
+        return f"{metadata['doc_id']}:{metadata['chunk']}"
+    return document.page_content
+
+
+class BM25Index:
+    """
+    Persistent BM25 inverted index over chunk text.
+
+    Postings live in SQLite next to the vector store and are added batch by
+    batch during ingestion, with the same add()/persist() interface as the
+    vector indexes. Collection statistics (chunk count, total length) are
+    kept in a meta table so scoring never scans the corpus. Deleting a
+    document removes its postings immediately; compact() reclaims the space.
+    """
+
+    def __init__(self, db_path, k1=None, b=None):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.k1 = k1 if k1 is not None else config.BM25_K1
+        self.b = b if b is not None else config.BM25_B
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "id INTEGER PRIMARY KEY, chunk_id TEXT UNIQUE NOT NULL, doc_id TEXT, "
+            "length INTEGER NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term TEXT NOT NULL, chunk INTEGER NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (term, chunk))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_doc_id ON chunks (doc_id)")
+        # Deleting a document removes postings by chunk
+        self._conn.execute("CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('chunks', 0), ('total_length', 0), ('deleted', 0)")
+        self._conn.commit()
+
+    def add(self, ids, vectors, metadatas, texts):
+        # vectors are ignored; the signature matches the vector indexes so
+        # one ingest writer can feed both
+        with self._lock:
+            added = 0
+            added_length = 0
+            for chunk_id, metadata, text in zip(ids, metadatas, texts):
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO chunks (chunk_id, doc_id, length, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                    (chunk_id, metadata.get("doc_id"), length, text, json.dumps(metadata, default=str)),
+                )
+                if cursor.rowcount == 0:
+                    continue
+                self._conn.executemany(
+                    "INSERT INTO postings (term, chunk, tf) VALUES (?, ?, ?)",
+                    [(term, cursor.lastrowid, tf) for term, tf in terms.items()],
+                )
+                added += 1
+                added_length += length
+            self._conn.execute("UPDATE meta SET value = value + ? WHERE key = 'chunks'", (added,))
+            self._conn.execute("UPDATE meta SET value = value + ? WHERE key = 'total_length'", (added_length,))
+
+    def persist(self):
+        with self._lock:
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT value FROM meta WHERE key = 'chunks'").fetchone()[0]
+
+    def delete_document(self, doc_id):
+        with self._lock:
+            removed, removed_length = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+            if removed == 0:
+                return 0
+            self._conn.execute("DELETE FROM postings WHERE chunk IN (SELECT id FROM chunks WHERE doc_id = ?)", (doc_id,))
+            self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            self._conn.execute("UPDATE meta SET value = value - ? WHERE key = 'chunks'", (removed,))
+            self._conn.execute("UPDATE meta SET value = value - ? WHERE key = 'total_length'", (removed_length,))
+            self._conn.execute("UPDATE meta SET value = value + ? WHERE key = 'deleted'", (removed,))
+            self._conn.commit()
+            return removed
+
+    def needs_compaction(self):
+        with self._lock:
+            meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        return (meta["deleted"] >= config.COMPACTION_MIN_TOMBSTONES
+                and meta["deleted"] >= config.COMPACTION_TOMBSTONE_RATIO * (meta["chunks"] + meta["deleted"]))
+
+    def compact(self):
+        with self._lock:
+            self._conn.execute("UPDATE meta SET value = 0 WHERE key = 'deleted'")
+            self._conn.commit()
+            # Rewrites the file without the pages freed by deleted postings
+            self._conn.execute("VACUUM")
+
+    def search(self, query, k, doc_ids=None):
+        """
+        Return the top-k chunks for a query.
+
+        Returns:
+            tuple: (Documents best first, confidence) where confidence in
+                   [0, 1] combines how much of the query the top chunk covers,
+                   how specific the matched terms are and how clearly it beats
+                   the runner-up
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return [], 0.0
+        with self._lock:
+            meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+            num_chunks = meta["chunks"]
+            if num_chunks == 0:
+                return [], 0.0
+            avg_length = meta["total_length"] / num_chunks
+
+            doc_filter = ""
+            params = []
+            if doc_ids:
+                doc_ids = list(doc_ids)
+                doc_filter = f" AND c.doc_id IN ({','.join('?' * len(doc_ids))})"
+                params = doc_ids
+
+            scores = Counter()
+            matched = {}
+            idfs = {}
+            for term in terms:
+                df = self._conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                idfs[term] = math.log(1 + (num_chunks - df + 0.5) / (df + 0.5))
+                if df == 0:
+                    continue
+                rows = self._conn.execute(
+                    "SELECT p.chunk, p.tf, c.length FROM postings p JOIN chunks c ON c.id = p.chunk "
+                    "WHERE p.term = ?" + doc_filter,
+                    [term, *params],
+                ).fetchall()
+                for chunk, tf, length in rows:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk] += idfs[term] * tf * (self.k1 + 1) / (tf + norm)
+                    matched.setdefault(chunk, set()).add(term)
+
+            ranked = scores.most_common(max(k, 2))
+            top = [chunk for chunk, _ in ranked[:k]]
+            if not top:
+                return [], 0.0
+            matched_idfs = [idfs[term] for term in matched[top[0]]]
+            coverage = sum(matched_idfs) / sum(idfs.values())
+            specificity = min(1.0, sum(matched_idfs) / len(matched_idfs) / config.BM25_FAST_PATH_MIN_IDF)
+            best = ranked[0][1]
+            runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+            separation = min(1.0, (best - runner_up) / best / config.BM25_FAST_PATH_MIN_MARGIN)
+            confidence = coverage * specificity * separation
+
+            rows = self._conn.execute(
+                f"SELECT id, text, metadata FROM chunks WHERE id IN ({','.join('?' * len(top))})", top
+            ).fetchall()
+        by_id = {row[0]: Document(page_content=row[1], metadata=json.loads(row[2])) for row in rows}
+        return [by_id[chunk] for chunk in top if chunk in by_id], confidence
+
+
+def reciprocal_rank_fusion(result_lists, k=None, with_scores=False):
+    """
+    Merge ranked Document lists with reciprocal rank fusion.
+
+    Each chunk scores sum(1 / (k + rank)) over the lists it appears in, so
+    chunks ranked well by both retrievers rise to the top without having to
+    calibrate BM25 scores against vector distances. With with_scores, returns
+    (Document, score) pairs instead of Documents.
+    """
+    k = k or config.RRF_K
+    scores = Counter()
+    documents = {}
+    for results in result_lists:
+        for rank, document in enumerate(results, 1):
+            key = chunk_key(document)
+            scores[key] += 1.0 / (k + rank)
+            documents.setdefault(key, document)
+    if with_scores:
+        return [(documents[key], score) for key, score in scores.most_common()]
+    return [documents[key] for key, _ in scores.most_common()]
@@ -0,0 +1,84 @@
+import os
+import logging
+import threading
+from collections import Counter
+from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from langchain_groq import ChatGroq
+
+logger = logging.getLogger(__name__)
+
+
+def _google_chat(model, **params):
+    return ChatGoogleGenerativeAI(model=model, google_api_key=os.environ.get("GOOGLE_API_KEY"), **params)
+
+
+def _groq_chat(model, **params):
+    return ChatGroq(groq_api_key=os.environ.get("GROQ_API_KEY"), model_name=model, **params)
+
+
+def _google_embeddings(model, **params):
+    return GoogleGenerativeAIEmbeddings(model=model, **params)
+
+
+PROVIDERS = {
+    "google": _google_chat,
+    "groq": _groq_chat,
+    "google-embeddings": _google_embeddings,
+}
+
+_clients = {}
+_created = Counter()
+_requests = Counter()
+_lock = threading.Lock()
+
+
+def _client_key(provider, model, params):
+    return (provider, model, tuple(sorted((params or {}).items())))
+
+
+def get_client(provider, model, params=None):
+    """
+    Return the process-wide client for (provider, model, params), creating it on first use.
+
+    Args:
+        provider (str): A key of PROVIDERS
+        model (str): Model name
+        params (dict, optional): Constructor arguments that need a separate client
+    """
+    key = _client_key(provider, model, params)
+    with _lock:
+        _requests[f"{provider}:{model}"] += 1
+        client = _clients.get(key)
+        if client is None:
+            client = PROVIDERS[provider](model, **(params or {}))
+            _clients[key] = client
+            _created[f"{provider}:{model}"] += 1
+            logger.info(f"Created {provider} client for {model}")
+        return client
+
+
+def get_chat_model(provider, model, params=None, **overrides):
+    """
+    Return a chat model, applying per-request sampling overrides.
+
+    Overrides (temperature, top_p, max_output_tokens, ...) are set on a
+    shallow copy of the shared client, so the copy reuses its HTTP transport
+    instead of opening new connections.
+    """
+    client = get_client(provider, model, params)
+    if overrides:
+        return client.model_copy(update=overrides)
+    return client
+
+
+def get_embeddings_model(model, params=None):
+    return get_client("google-embeddings", model, params)
+
+
+def stats():
+    with _lock:
+        return {
+            "clients": len(_clients),
+            "created": dict(_created),
+            "requests": dict(_requests),
+        }
@@ -0,0 +1,95 @@
+import time
+import logging
+import threading
+import core_module.config as config
+
+logger = logging.getLogger(__name__)
+
+
+class Compactor:
+    """
+    Background job that compacts QA indexes after documents are deleted.
+
+    Deletes only tombstone chunks, which keeps them fast; the indexes still
+    carry the dead entries until compact() rebuilds them. The job wakes up
+    every COMPACTION_INTERVAL_SECONDS, or right away when notified of a
+    delete, and compacts each index whose needs_compaction() is true.
+    """
+
+    def __init__(self, get_indexes, interval=None):
+        """
+        Args:
+            get_indexes (callable): Returns the indexes to check on each pass
+            interval (float, optional): Seconds between passes; defaults to config.COMPACTION_INTERVAL_SECONDS
+        """
+        self.get_indexes = get_indexes
+        self.interval = interval if interval is not None else config.COMPACTION_INTERVAL_SECONDS
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self.passes = 0
+        self.compactions = 0
+        self.failures = 0
+        self.last_duration = 0.0
+        self._thread = threading.Thread(target=self._loop, name="index-compactor", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.run_once()
+
+    def run_once(self):
+        """Compact every index that needs it; returns how many were compacted."""
+        compacted = 0
+        for index in self.get_indexes():
+            try:
+                if not index.needs_compaction():
+                    continue
+                start = time.time()
+                index.compact()
+                compacted += 1
+                with self._lock:
+                    self.last_duration = time.time() - start
+            except Exception as e:
+                logger.error(f"Compacting {type(index).__name__} failed: {str(e)}")
+                with self._lock:
+                    self.failures += 1
+        with self._lock:
+            self.passes += 1
+            self.compactions += compacted
+        return compacted
+
+    def notify(self):
+        self._wake.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "passes": self.passes,
+                "compactions": self.compactions,
+                "failures": self.failures,
+                "last_duration": round(self.last_duration, 3),
+            }
+
+
+_compactor = None
+_compactor_lock = threading.Lock()
+
+
+def start_compactor(get_indexes):
+    """Start the process-wide compactor (only the first call starts it)."""
+    global _compactor
+    with _compactor_lock:
+        if _compactor is None:
+            _compactor = Compactor(get_indexes)
+        return _compactor
+
+
+def notify():
+    if _compactor is not None:
+        _compactor.notify()
+
+
+def stats():
+    return _compactor.stats() if _compactor is not None else {}
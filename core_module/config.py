@@ -7,6 +7,125 @@ REPORT_CHUNK_OVERLAP=200
 QA_CHUNK_SIZE=1000
 QA_CHUNK_OVERLAP=200
 
+# On-disk cache of parsed pages and chunk lists (least recently used entries are evicted)
+DOCUMENT_CACHE_MAX_MB=512
+
+# Finished summaries and reports, keyed by document hash and generation parameters
+RESULT_CACHE_MAX_MB=256
+RESULT_CACHE_TTL_HOURS=168  # one week
+
+# Parallel PDF page extraction (0 = one worker per CPU)
+PDF_EXTRACT_WORKERS=0
+PDF_PAGES_PER_TASK=8
+PDF_PARALLEL_MIN_PAGES=16  # smaller files are parsed serially
+PDF_MAX_PAGES_IN_FLIGHT=64  # bounds memory while streaming pages
+
+# QA vector index: "chroma" or "faiss" (flat, hnsw or ivfpq)
+VECTOR_BACKEND = "chroma"
+FAISS_INDEX_TYPE = "hnsw"
+FAISS_HNSW_M=32
+FAISS_HNSW_EF_CONSTRUCTION=80
+FAISS_HNSW_EF_SEARCH=64
+FAISS_IVF_NLIST=1024
+FAISS_IVF_NPROBE=16
+FAISS_IVF_TRAIN_MIN=10000  # ivfpq stays exact (flat) below this many vectors
+FAISS_PQ_M=96  # sub-quantizers (a divisor of the embedding dimension is used)
+
+# QA retrieval: "dense" (vectors only), "hybrid" (BM25 + vectors fused with
+# reciprocal rank fusion) or "fast" (hybrid, but BM25 alone when it is confident,
+# which skips the query embedding call)
+RETRIEVAL_MODE = "hybrid"
+AVAILABLE_RETRIEVAL_MODES = ("dense", "hybrid", "fast")
+RETRIEVAL_CANDIDATES=20  # results taken from each retriever before fusion
+RRF_K=60
+BM25_K1=1.5
+BM25_B=0.75
+# Fast-path confidence is the product of three factors in [0, 1]: the
+# IDF-weighted share of query terms in the top BM25 hit, the mean IDF of the
+# matched terms over BM25_FAST_PATH_MIN_IDF (common words carry little
+# evidence), and the top hit's score margin over the runner-up as a share of
+# its score, over BM25_FAST_PATH_MIN_MARGIN (a near-tie is not a clear answer)
+BM25_FAST_PATH_CONFIDENCE=0.9
+BM25_FAST_PATH_MIN_IDF=2.0  # about a term in at most 1 chunk in 8
+BM25_FAST_PATH_MIN_MARGIN=0.2
+
+# Deleted QA documents leave tombstoned chunks behind; a background job
+# compacts an index once enough of it is dead
+COMPACTION_INTERVAL_SECONDS=300
+COMPACTION_TOMBSTONE_RATIO=0.2  # share of the index that must be deleted
+COMPACTION_MIN_TOMBSTONES=100
+
+# Semantic QA answer cache: a question reuses a cached answer when its
+# embedding is at least this cosine-similar to an earlier question asked
+# against the same (unchanged) documents
+QA_ANSWER_CACHE_THRESHOLD=0.95
+QA_ANSWER_CACHE_MAX_ENTRIES=512  # answers kept per collection/model/mode
+QA_ANSWER_CACHE_MAX_SCOPES=256
+QA_RETRIEVAL_CACHE_MAX_ENTRIES=2048  # normalized questions with cached embeddings and top-k chunks
+
+# Maximal marginal relevance: over-fetch max(k * QA_MMR_FETCH_FACTOR,
+# QA_MMR_FETCH_K) candidates and pick the final k trading relevance
+# (lambda 1) against diversity (lambda 0). Diversity is the chunk-chunk
+# cosine similarity. Relevance is the query-chunk cosine similarity for
+# dense results (standard MMR), and for fused hybrid results the RRF score
+# divided by the best candidate's, so near-tied chunks stay near-tied.
+QA_USE_MMR=True
+QA_MMR_FETCH_K=20
+QA_MMR_FETCH_FACTOR=5
+QA_MMR_LAMBDA=0.5
+
+# QA context packing: overlapping chunks are merged and repeated sentences
+# dropped, then chunks are added by relevance up to the model's token budget
+QA_CONTEXT_TOKEN_BUDGET=3000
+QA_CONTEXT_TOKEN_BUDGETS = {
+    "Llama3-8b-8192": 3000,  # 8k context window
+    "gemini-2.5-pro-exp-03-25": 12000,
+}
+QA_CONTEXT_CHUNKS=4  # chunks retrieved per question; packing only shrinks them, the budget is a cap
+
+# Batch question answering (/api/questions/ask-batch)
+QA_BATCH_MAX_QUESTIONS=32
+QA_BATCH_MAX_CONCURRENCY=4  # LLM calls in flight per batch
+
+# Streaming ingestion into the vector store
+INGEST_BATCH_SIZE=256  # chunks embedded and written per batch
+MAX_UPLOAD_MB=64
+
+# Persistent embedding cache keyed by (embed model, sha256(chunk text))
+EMBEDDING_CACHE_MAX_ENTRIES=100000
+
+# Embedding requests: adaptive batches, several in flight at once
+EMBED_BATCH_SIZE=32
+EMBED_MIN_BATCH_SIZE=4
+EMBED_MAX_BATCH_SIZE=100
+EMBED_MAX_IN_FLIGHT=4
+EMBED_TARGET_LATENCY=2.0  # seconds per batch before the batch size shrinks
+EMBED_MAX_RETRIES=3
+
+# Section selection: "embedding" clusters remote embeddings, "local" clusters
+# TF-IDF vectors in-process (no embedding calls before the LLM starts)
+AVAILABLE_SELECTION_STRATEGIES = {
+    "embedding": "Cluster chunk embeddings",
+    "local": "Cluster TF-IDF vectors locally"
+}
+SECTION_SELECTION_STRATEGY = "embedding"
+TFIDF_MAX_FEATURES=20000
+TFIDF_SVD_COMPONENTS=100
+
+# K-means clustering used by section selection (seeded so summaries are reproducible)
+SECTION_SELECTOR_SEED=42
+KMEANS_MAX_ITER=100
+KMEANS_TOL=1e-4
+KMEANS_BATCH_SIZE=1024  # larger documents use mini-batch updates
+KMEANS_PATIENCE=10  # mini-batches without inertia improvement before stopping
+
+# Map-reduce summarization for long documents
+MAP_REDUCE_MIN_CHUNKS=60  # documents with at least this many chunks use map-reduce
+MAP_REDUCE_GROUP_TOKENS=6000  # input tokens per map call
+MAP_REDUCE_PARTIAL_TOKENS=1024  # output tokens per partial summary
+MAP_REDUCE_MAX_WORKERS=4  # concurrent map/reduce LLM calls
+REDUCE_TOKEN_BUDGET=12000  # partial summaries are reduced again above this size
+
 
 # Available models for each feature
 AVAILABLE_SUMMARIZER_MODELS = {
@@ -0,0 +1,157 @@
+import re
+import logging
+from langchain_core.documents import Document
+import core_module.config as config
+
+logger = logging.getLogger(__name__)
+
+# Sentences (or lines) are the unit of deduplication; short ones such as
+# headings and list markers are always kept
+_SENTENCE = re.compile(r"[^.!?\n]*(?:[.!?]+|\n)|[^.!?\n]+$")
+MIN_DEDUP_CHARS = 40
+
+# Chunks this close are adjacent (the splitter drops the separator between them)
+MAX_GAP_CHARS = 2
+
+# How much of a chunk's head is searched for in its neighbour when chunks
+# carry no start_index (indexed before offsets were recorded)
+_ANCHOR_CHARS = 64
+
+
+def estimate_tokens(text):
+    # Rough token count (about four characters per token)
+    return len(text) // 4
+
+
+def token_budget(model_name):
+    """Context tokens a QA model's prompt may spend on retrieved chunks."""
+    return config.QA_CONTEXT_TOKEN_BUDGETS.get(model_name, config.QA_CONTEXT_TOKEN_BUDGET)
+
+
+def _source(document):
+    metadata = document.metadata
+    return metadata.get("doc_id") or metadata.get("source"), metadata.get("page")
+
+
+class _Span:
+    """Contiguous text of one page, built from one or more retrieved chunks."""
+
+    def __init__(self, document, rank):
+        self.text = document.page_content
+        self.start = document.metadata.get("start_index")
+        self.metadata = dict(document.metadata)
+        self.chunks = [document.metadata.get("chunk")]
+        self.rank = rank
+
+    def _join(self, other):
+        # Overlap of other's head with this span's tail (negative for a small
+        # gap), or None if they do not touch. Prefers recorded offsets, falls
+        # back to matching text.
+        if self.start is not None and other.start is not None:
+            if other.start < self.start:
+                return None
+            overlap = self.start + len(self.text) - other.start
+            return overlap if overlap >= -MAX_GAP_CHARS else None
+        anchor = other.text[:_ANCHOR_CHARS]
+        position = self.text.find(anchor, max(0, len(self.text) - config.QA_CHUNK_OVERLAP - _ANCHOR_CHARS))
+        if anchor and position >= 0 and other.text.startswith(self.text[position:]):
+            return len(self.text) - position
+        if other.text in self.text:
+            return len(other.text)
+        return None
+
+    def merge(self, other):
+        """Absorb a span that continues or overlaps this one; False if they are apart."""
+        for first, second in ((self, other), (other, self)):
+            overlap = first._join(second)
+            if overlap is None:
+                continue
+            text = first.text + (second.text[overlap:] if overlap >= 0 else "\n" + second.text)
+            start = first.start
+            metadata = self.metadata if self.rank <= other.rank else other.metadata
+            self.text, self.start, self.metadata = text, start, metadata
+            self.chunks = sorted(c for c in set(self.chunks + other.chunks) if c is not None)
+            self.rank = min(self.rank, other.rank)
+            return True
+        return False
+
+
+def merge_chunks(documents):
+    """
+    Merge adjacent or overlapping chunks from the same page.
+
+    Args:
+        documents (list): Retrieved Documents, most relevant first
+
+    Returns:
+        list: Spans ordered by the relevance of their best chunk
+    """
+    spans = []
+    for rank, document in enumerate(documents):
+        span = _Span(document, rank)
+        # A chunk can bridge two spans, so keep merging until nothing touches
+        merged = True
+        while merged:
+            merged = False
+            for existing in spans:
+                if _source(existing) == _source(span) and existing.merge(span):
+                    spans.remove(existing)
+                    span = existing
+                    merged = True
+                    break
+        spans.append(span)
+    return sorted(spans, key=lambda span: span.rank)
+
+
+def _dedupe(text, seen):
+    # Drop sentences already included from a more relevant span
+    kept = []
+    for sentence in _SENTENCE.findall(text):
+        key = " ".join(sentence.split()).lower()
+        if len(key) >= MIN_DEDUP_CHARS:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(sentence)
+    return "".join(kept).strip()
+
+
+def pack_context(documents, budget=None):
+    """
+    Build the QA context from retrieved chunks.
+
+    Overlapping and adjacent chunks of a page are merged into one span,
+    sentences repeated across spans are kept only in the most relevant one,
+    and spans are added in relevance order while they fit the token budget.
+
+    Args:
+        documents (list): Retrieved Documents, most relevant first
+        budget (int, optional): Context token budget; defaults to config.QA_CONTEXT_TOKEN_BUDGET
+
+    Returns:
+        list: Documents to stuff into the prompt
+    """
+    budget = budget or config.QA_CONTEXT_TOKEN_BUDGET
+    packed = []
+    used = 0
+    seen = set()
+    for span in merge_chunks(documents):
+        text = _dedupe(span.text, seen)
+        if not text:
+            continue
+        tokens = estimate_tokens(text)
+        if used + tokens > budget:
+            if packed:
+                # Smaller, less relevant spans may still fit
+                continue
+            # Never send an empty context: cut the best span to the budget
+            text = text[:budget * 4]
+            tokens = estimate_tokens(text)
+        metadata = {**span.metadata, "chunks": span.chunks}
+        if span.start is not None:
+            metadata["start_index"] = span.start
+        packed.append(Document(page_content=text, metadata=metadata))
+        used += tokens
+
+    logger.info(f"Packed {len(documents)} chunks into {len(packed)} spans (~{used} tokens)")
+    return packed
@@ -0,0 +1,121 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+CACHE_ROOT = os.path.join(current_dir, "cache")
+
+
+def make_key(*parts):
+    """Build a filesystem-safe cache key from arbitrary JSON-serialisable parts."""
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    A directory of cache files bounded by total size.
+
+    Entries are plain files written atomically (temp file + rename). Reads
+    touch the file's mtime, so eviction removes the least recently used
+    entries first once the directory grows past max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes, suffix=".json"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    # Return the path of a cached entry (marking it as recently used) or None
+    def get_path(self, key):
+        path = self.path_for(key)
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def contains(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def get_json(self, key):
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable cache entry {path}: {str(e)}")
+            self.delete(key)
+            return None
+
+    def set_json(self, key, value):
+        with self.writer(key, mode="w") as f:
+            json.dump(value, f)
+
+    def delete(self, key):
+        try:
+            os.remove(self.path_for(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    @contextmanager
+    def writer(self, key, mode="w"):
+        """Open a temp file for an entry; it is published only if the block succeeds."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        encoding = None if "b" in mode else "utf-8"
+        try:
+            with os.fdopen(fd, mode, encoding=encoding) as f:
+                yield f
+            os.replace(tmp_path, self.path_for(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    # Remove least recently used entries until the cache fits in max_bytes
+    def evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                if not name.endswith(self.suffix):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            if total <= self.max_bytes:
+                return 0
+
+            removed = 0
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            logger.info(f"Evicted {removed} entries from {self.directory}")
+            return removed
@@ -0,0 +1,119 @@
+import os
+import json
+import logging
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
+import core_module.config as config
+from core_module.pdf_extract import iter_pdf_pages
+from core_module.disk_cache import DiskCache, CACHE_ROOT, make_key
+from core_module.upload_store import file_sha256
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the parsing or splitting output changes so stale entries are ignored
+CACHE_FORMAT_VERSION = 4
+
+# Parsed pages and chunk lists share one size-bounded directory. Entries are
+# JSON Lines (one Document per line) so they can be streamed back.
+_cache = DiskCache(
+    os.path.join(CACHE_ROOT, "documents"),
+    max_bytes=config.DOCUMENT_CACHE_MAX_MB * 1024 * 1024,
+    suffix=".jsonl",
+)
+
+
+def get_loader(file_path):
+    # Detect file type by extension
+    file_extension = file_path.lower().split('.')[-1]
+
+    if file_extension == 'pdf':
+        return PyPDFLoader(file_path)
+    elif file_extension == 'docx':
+        return Docx2txtLoader(file_path)
+    elif file_extension == 'txt':
+        return TextLoader(file_path)
+    else:
+        raise ValueError(f"Unsupported file type: {file_extension}. Supported types are pdf, docx, and txt.")
+
+
+def get_text_splitter(chunk_size, chunk_overlap):
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", " ", ""],
+        # Page offsets let the QA context packer merge overlapping chunks
+        add_start_index=True
+    )
+
+
+def _pages_key(file_hash):
+    return make_key("pages", CACHE_FORMAT_VERSION, file_hash)
+
+
+def _chunks_key(file_hash, chunk_size, chunk_overlap):
+    return make_key("chunks", CACHE_FORMAT_VERSION, file_hash, chunk_size, chunk_overlap)
+
+
+def _read_documents(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            yield Document(page_content=record["page_content"], metadata=record["metadata"])
+
+
+def _tee_to_cache(key, documents):
+    # Yield documents while writing them to the cache; the entry is only
+    # published if the whole sequence was produced.
+    with _cache.writer(key) as f:
+        for doc in documents:
+            f.write(json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}, default=str))
+            f.write("\n")
+            yield doc
+
+
+def iter_pages(file_path, file_hash=None):
+    """Yield the parsed pages of a document, parsing it only on a cache miss."""
+    file_hash = file_hash or file_sha256(file_path)
+    key = _pages_key(file_hash)
+    cached = _cache.get_path(key)
+    if cached is not None:
+        logger.info(f"Parsed-page cache hit for {file_hash}")
+        yield from _read_documents(cached)
+        return
+
+    logger.info(f"Parsed-page cache miss for {file_hash}, parsing {file_path}")
+    if file_path.lower().endswith('.pdf'):
+        pages = iter_pdf_pages(file_path)
+    else:
+        pages = get_loader(file_path).lazy_load()
+    yield from _tee_to_cache(key, pages)
+
+
+def iter_chunks(file_path, chunk_size, chunk_overlap, file_hash=None):
+    """Yield the split chunks of a document for the given chunk settings."""
+    file_hash = file_hash or file_sha256(file_path)
+    key = _chunks_key(file_hash, chunk_size, chunk_overlap)
+    cached = _cache.get_path(key)
+    if cached is not None:
+        logger.info(f"Chunk cache hit for {file_hash} ({chunk_size}/{chunk_overlap})")
+        yield from _read_documents(cached)
+        return
+
+    # The splitter works page by page, so splitting incrementally gives the
+    # same chunks as split_documents() over the full page list.
+    text_splitter = get_text_splitter(chunk_size, chunk_overlap)
+
+    def split_pages():
+        for page in iter_pages(file_path, file_hash):
+            yield from text_splitter.split_documents([page])
+
+    yield from _tee_to_cache(key, split_pages())
+
+
+def load_pages(file_path, file_hash=None):
+    return list(iter_pages(file_path, file_hash))
+
+
+def load_chunks(file_path, chunk_size, chunk_overlap, file_hash=None):
+    return list(iter_chunks(file_path, chunk_size, chunk_overlap, file_hash))
@@ -0,0 +1,195 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from langchain_core.embeddings import Embeddings
+import core_module.config as config
+from core_module.disk_cache import CACHE_ROOT
+from core_module.embedding_dispatcher import EmbeddingDispatcher
+from core_module import clients
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DB_PATH = os.path.join(CACHE_ROOT, "embeddings.sqlite3")
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _pack(vector):
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingStore:
+    """
+    SQLite table of embeddings stored as float32 blobs.
+
+    Rows are keyed by (model, kind, sha256(text)) and carry a last-used
+    timestamp; the least recently used rows are deleted once the table holds
+    more than max_entries vectors.
+    """
+
+    def __init__(self, db_path=EMBEDDING_DB_PATH, max_entries=None):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.max_entries = max_entries or config.EMBEDDING_CACHE_MAX_ENTRIES
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, kind TEXT NOT NULL, text_hash TEXT NOT NULL, "
+            "vector BLOB NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (model, kind, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, model, kind, hashes):
+        """Return {text_hash: vector} for the hashes present in the cache."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND kind = ? "
+                    f"AND text_hash IN ({placeholders})",
+                    [model, kind, *batch],
+                ).fetchall()
+                for row_hash, blob in rows:
+                    found[row_hash] = _unpack(blob)
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND kind = ? AND text_hash = ?",
+                    [(now, model, kind, h) for h in found],
+                )
+                self._conn.commit()
+            hit_count = sum(1 for h in hashes if h in found)
+            self.hits += hit_count
+            self.misses += len(hashes) - hit_count
+        return found
+
+    def put_many(self, model, kind, items):
+        """Store (text_hash, vector) pairs."""
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, kind, text_hash, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(model, kind, h, _pack(vector), now) for h, vector in items],
+            )
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Drop down to 90% of the budget so eviction does not run on every insert
+        excess = self._count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,),
+        )
+        self._count -= excess
+        self.evictions += excess
+        logger.info(f"Evicted {excess} cached embeddings")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._count,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends texts missing from the EmbeddingStore to the backend."""
+
+    def __init__(self, inner, model_name, store=None):
+        self.inner = inner
+        self.model_name = model_name
+        self.store = store or get_embedding_store()
+
+    def embed_documents(self, texts):
+        return self._embed(texts, "document", self.inner.embed_documents)
+
+    def embed_query(self, text):
+        return self._embed([text], "query", lambda missing: [self.inner.embed_query(missing[0])])[0]
+
+    def embed_queries(self, texts):
+        # Many questions in one batched request, embedded as queries rather
+        # than documents
+        return self._embed(texts, "query",
+                           lambda missing: self.inner.embed_documents(missing, task_type="RETRIEVAL_QUERY"))
+
+    def _embed(self, texts, kind, compute):
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.store.get_many(self.model_name, kind, hashes)
+
+        # Embed each missing text once, even if it appears several times
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in vectors and h not in missing:
+                missing[h] = text
+        if missing:
+            computed = compute(list(missing.values()))
+            new_items = list(zip(missing.keys(), computed))
+            self.store.put_many(self.model_name, kind, new_items)
+            vectors.update(new_items)
+
+        return [vectors[h] for h in hashes]
+
+
+_store = None
+_embeddings = {}
+_lock = threading.RLock()
+
+
+def get_embedding_store():
+    """Return the process-wide embedding store."""
+    global _store
+    if _store is None:
+        with _lock:
+            if _store is None:
+                _store = EmbeddingStore()
+    return _store
+
+
+def get_cached_embeddings(model_name=None):
+    """Return a cached embeddings client for a model (one per process)."""
+    model_name = model_name or config.EMBED_MODEL
+    with _lock:
+        if model_name not in _embeddings:
+            # Cache misses go through the dispatcher, which batches them and
+            # keeps several requests in flight
+            dispatcher = EmbeddingDispatcher(clients.get_embeddings_model(model_name))
+            _embeddings[model_name] = CachedEmbeddings(dispatcher, model_name)
+        return _embeddings[model_name]
+
+
+def dispatcher_stats():
+    with _lock:
+        return {model: embeddings.inner.stats() for model, embeddings in _embeddings.items()}
@@ -0,0 +1,156 @@
+import time
+import random
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from langchain_core.embeddings import Embeddings
+import core_module.config as config
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingDispatcher(Embeddings):
+    """
+    Sends embed_documents() calls to a backend in batches, several at a time.
+
+    Up to max_in_flight batches run concurrently on a thread pool. The batch
+    size grows while batches come back faster than target_latency and shrinks
+    when they are slow or fail. A failed batch is retried one text at a time,
+    so one bad input does not fail the whole request.
+    """
+
+    def __init__(self, backend, batch_size=None, min_batch_size=None, max_batch_size=None,
+                 max_in_flight=None, target_latency=None, max_retries=None):
+        self.backend = backend
+        self.min_batch_size = min_batch_size or config.EMBED_MIN_BATCH_SIZE
+        self.max_batch_size = max_batch_size or config.EMBED_MAX_BATCH_SIZE
+        self.batch_size = batch_size or config.EMBED_BATCH_SIZE
+        self.max_in_flight = max_in_flight or config.EMBED_MAX_IN_FLIGHT
+        self.target_latency = target_latency or config.EMBED_TARGET_LATENCY
+        self.max_retries = max_retries if max_retries is not None else config.EMBED_MAX_RETRIES
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embed")
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.failed_batches = 0
+        self.retried_texts = 0
+
+    def embed_query(self, text):
+        return self.backend.embed_query(text)
+
+    def embed_documents(self, texts, **kwargs):
+        texts = list(texts)
+        results = [None] * len(texts)
+        position = 0
+        in_flight = {}
+
+        while position < len(texts) or in_flight:
+            # Batches are cut lazily so they pick up the latest batch size
+            while position < len(texts) and len(in_flight) < self.max_in_flight:
+                end = min(position + self.batch_size, len(texts))
+                future = self._executor.submit(self._run_batch, texts[position:end], kwargs)
+                in_flight[future] = (position, end, False)
+                position = end
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, end, is_retry = in_flight.pop(future)
+                if is_retry:
+                    # Raises if a text still fails after max_retries attempts
+                    results[start:end] = future.result()
+                    continue
+
+                vectors, elapsed, error = future.result()
+                self._adapt(end - start, elapsed, error)
+                if error is None:
+                    results[start:end] = vectors
+                else:
+                    logger.warning(f"Embedding batch of {end - start} failed ({error}); retrying texts individually")
+                    retry = self._executor.submit(self._run_individually, texts[start:end], kwargs)
+                    in_flight[retry] = (start, end, True)
+
+        return results
+
+    def _run_batch(self, batch, kwargs):
+        start = time.perf_counter()
+        try:
+            vectors = self.backend.embed_documents(batch, **kwargs)
+            return vectors, time.perf_counter() - start, None
+        except Exception as e:
+            return None, time.perf_counter() - start, e
+
+    def _run_individually(self, batch, kwargs):
+        vectors = []
+        for text in batch:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    vectors.append(self.backend.embed_documents([text], **kwargs)[0])
+                    break
+                except Exception:
+                    if attempt == self.max_retries:
+                        raise
+                    time.sleep(min(2 ** attempt * 0.5, 8.0))
+            with self._lock:
+                self.retried_texts += 1
+        return vectors
+
+    # Additive increase while batches are fast, multiplicative decrease when
+    # they are slow or failing
+    def _adapt(self, size, elapsed, error):
+        with self._lock:
+            self.batches += 1
+            if error is not None:
+                self.failed_batches += 1
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            elif elapsed > self.target_latency * 1.5:
+                self.batch_size = max(self.min_batch_size, int(self.batch_size * 0.75))
+            elif elapsed < self.target_latency and size >= self.batch_size:
+                self.batch_size = min(self.max_batch_size, self.batch_size + max(1, self.batch_size // 4))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batch_size": self.batch_size,
+                "batches": self.batches,
+                "failed_batches": self.failed_batches,
+                "retried_texts": self.retried_texts,
+            }
+
+
+class FakeEmbeddingBackend(Embeddings):
+    """
+    Local stand-in for a remote embedding API, for tests and benchmarks.
+
+    Vectors are derived from the text hash, and each call sleeps for
+    latency + per_item_latency * len(texts). failure_rate makes a fraction
+    of calls raise, and batches larger than max_batch_size are rejected.
+    """
+
+    def __init__(self, dimensions=8, latency=0.05, per_item_latency=0.0, failure_rate=0.0,
+                 max_batch_size=None, seed=0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.failure_rate = failure_rate
+        self.max_batch_size = max_batch_size
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def embed_documents(self, texts, **kwargs):
+        with self._lock:
+            self.calls += 1
+            fail = self._random.random() < self.failure_rate
+        time.sleep(self.latency + self.per_item_latency * len(texts))
+        if fail:
+            raise RuntimeError("Injected embedding failure")
+        if self.max_batch_size and len(texts) > self.max_batch_size:
+            raise ValueError(f"Batch of {len(texts)} exceeds limit of {self.max_batch_size}")
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def _vector(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [digest[i % len(digest)] / 255.0 for i in range(self.dimensions)]
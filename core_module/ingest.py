@@ -0,0 +1,74 @@
+import logging
+from itertools import islice
+import core_module.config as config
+from core_module import document_cache
+
+logger = logging.getLogger(__name__)
+
+# Streaming ingestion:
+#   page generator -> incremental splitter -> batched embedder -> vector store writer
+# Every stage is a generator, so at most one batch of chunks (plus the pages
+# the PDF extractor keeps in flight) is held in memory at a time, and the
+# first batch is written before the last page has been parsed.
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def embed_batches(batches, embeddings):
+    for batch in batches:
+        vectors = embeddings.embed_documents([doc.page_content for doc in batch])
+        yield batch, vectors
+
+
+def index_writer(doc_id, *indexes):
+    # Write pre-computed vectors straight into the indexes (vector and BM25)
+    # so the store does not embed the texts a second time. Chunks get stable
+    # "<doc_id>:<n>" ids plus doc_id/chunk metadata for filtering, so
+    # re-ingesting the same document does not duplicate it.
+    next_chunk = 0
+
+    def write(documents, vectors):
+        nonlocal next_chunk
+        numbers = range(next_chunk, next_chunk + len(documents))
+        next_chunk += len(documents)
+        ids = [f"{doc_id}:{n}" for n in numbers]
+        metadatas = [{**doc.metadata, "doc_id": doc_id, "chunk": n} for doc, n in zip(documents, numbers)]
+        texts = [doc.page_content for doc in documents]
+        for index in indexes:
+            index.add(ids, vectors, metadatas, texts)
+    return write
+
+
+def ingest_document(file_path, embeddings, write_batch, chunk_size, chunk_overlap,
+                    batch_size=None, file_hash=None):
+    """
+    Stream a document into a vector store.
+
+    Args:
+        file_path (str): Document to ingest
+        embeddings: LangChain Embeddings used for the chunks
+        write_batch (callable): Called with (documents, vectors) for each batch
+        chunk_size (int): Splitter chunk size
+        chunk_overlap (int): Splitter chunk overlap
+        batch_size (int, optional): Chunks per embedding batch; defaults to config.INGEST_BATCH_SIZE
+        file_hash (str, optional): Precomputed SHA-256 of the file
+
+    Returns:
+        int: Number of chunks written
+    """
+    batch_size = batch_size or config.INGEST_BATCH_SIZE
+    chunks = document_cache.iter_chunks(file_path, chunk_size, chunk_overlap, file_hash)
+
+    total = 0
+    for batch_number, (documents, vectors) in enumerate(embed_batches(batched(chunks, batch_size), embeddings), 1):
+        write_batch(documents, vectors)
+        total += len(documents)
+        logger.info(f"Ingested batch {batch_number} ({total} chunks so far)")
+    return total
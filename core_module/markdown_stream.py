@@ -0,0 +1,105 @@
+class MarkdownNormalizer:
+    """
+    Incremental markdown clean-up for streamed LLM output.
+
+    Text is fed in arbitrary chunks and emitted as soon as each line's kind
+    (blank, heading, code fence or plain text) is known, which takes at most
+    a few characters of lookahead. It puts a space after heading hashes,
+    keeps a blank line before and after headings and collapses runs of blank
+    lines into one. Lines inside ``` code fences are passed through unchanged.
+    """
+
+    def __init__(self):
+        self._prefix = ""          # start of the current line, not classified yet
+        self._in_line = False      # current line is classified and being streamed
+        self._newlines = 0         # line breaks seen since the last emitted line
+        self._started = False
+        self._prev_heading = False
+        self._in_code = False
+
+    def feed(self, chunk):
+        """Consume a chunk and return the text that can be emitted so far."""
+        out = []
+        pos = 0
+        while pos < len(chunk):
+            end = chunk.find("\n", pos)
+            piece = chunk[pos:] if end == -1 else chunk[pos:end]
+            if self._in_line:
+                out.append(piece)
+            else:
+                self._prefix += piece
+                self._classify(out, final=end != -1)
+            if end == -1:
+                break
+            self._end_line()
+            pos = end + 1
+        return "".join(out)
+
+    def flush(self):
+        """Emit whatever is still held back at the end of the stream."""
+        out = []
+        if self._prefix:
+            self._classify(out, final=True)
+        if self._started and self._newlines:
+            out.append("\n" * (self._newlines if self._in_code else min(self._newlines, 2)))
+        self.__init__()
+        return "".join(out)
+
+    def _classify(self, out, final):
+        line = self._prefix
+        stripped = line.lstrip()
+        if not final:
+            # Wait until the line is known to be non-blank, and until the
+            # heading hashes or the fence backticks are complete
+            if not stripped or not line.lstrip("#"):
+                return
+            if len(stripped) < 3 and not stripped.strip("`"):
+                return
+        if not stripped:
+            # Blank line: only its line break counts
+            self._prefix = ""
+            return
+
+        is_heading = not self._in_code and line.startswith("#")
+        if self._started:
+            breaks = self._newlines if self._in_code else min(self._newlines, 2)
+            if not self._in_code and (is_heading or self._prev_heading):
+                breaks = 2
+            out.append("\n" * breaks)
+
+        if is_heading:
+            count = len(line) - len(line.lstrip("#"))
+            rest = line[count:]
+            if rest and not rest[0].isspace():
+                line = line[:count] + " " + rest
+        out.append(line)
+
+        if stripped.startswith("```"):
+            self._in_code = not self._in_code
+        self._prefix = ""
+        self._in_line = True
+        self._started = True
+        self._prev_heading = is_heading
+        self._newlines = 0
+
+    def _end_line(self):
+        self._prefix = ""
+        self._in_line = False
+        self._newlines += 1
+
+
+def normalize_stream(chunks):
+    """Yield normalized markdown for an iterable of text chunks."""
+    normalizer = MarkdownNormalizer()
+    for chunk in chunks:
+        text = normalizer.feed(chunk)
+        if text:
+            yield text
+    text = normalizer.flush()
+    if text:
+        yield text
+
+
+def normalize_markdown(text):
+    normalizer = MarkdownNormalizer()
+    return normalizer.feed(text) + normalizer.flush()
@@ -0,0 +1,69 @@
+import numpy as np
+import core_module.config as config
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def query_relevance(query_vector, candidate_vectors):
+    """Cosine similarity of each candidate to the query (the standard MMR relevance)."""
+    candidates = _normalize(np.asarray(candidate_vectors, dtype=np.float32))
+    return candidates @ _normalize(np.asarray(query_vector, dtype=np.float32))
+
+
+def score_relevance(scores):
+    """Fused retrieval scores scaled by the best one, so gaps keep their proportions."""
+    scores = np.asarray(scores, dtype=np.float32)
+    best = scores.max() if len(scores) else 0
+    return scores / best if best > 0 else scores
+
+
+def mmr(query_vector, candidate_vectors, k, lambda_mult=None, relevance=None):
+    """
+    Pick k candidates by maximal marginal relevance.
+
+    Each step takes the candidate maximising
+    lambda * rel(c) - (1 - lambda) * max sim(c, already selected),
+    where rel(c) is sim(query, c) unless relevance scores are given. All
+    similarities come from matrix products up front; each step is then a
+    couple of vector operations over the candidates.
+
+    Args:
+        query_vector (list): Query embedding; unused when relevance is given
+        candidate_vectors (list): Candidate embeddings, one per row (all-zero
+            rows are similar to nothing)
+        k (int): Number of candidates to select
+        lambda_mult (float, optional): 1 is pure relevance, 0 pure diversity;
+            defaults to config.QA_MMR_LAMBDA
+        relevance (list, optional): Relevance of each candidate in [0, 1],
+            e.g. score_relevance() of fused retrieval scores
+
+    Returns:
+        list: Indices of the selected candidates, in selection order
+    """
+    lambda_mult = config.QA_MMR_LAMBDA if lambda_mult is None else lambda_mult
+    candidates = _normalize(np.asarray(candidate_vectors, dtype=np.float32))
+    if len(candidates) == 0 or k <= 0:
+        return []
+
+    pairwise = candidates @ candidates.T
+    if relevance is None:
+        relevance = query_relevance(query_vector, candidates)
+    else:
+        relevance = np.asarray(relevance, dtype=np.float32)
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    redundancy = pairwise[first].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[first] = False
+    for _ in range(min(k, len(candidates)) - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        chosen = int(np.argmax(scores))
+        selected.append(chosen)
+        available[chosen] = False
+        np.maximum(redundancy, pairwise[chosen], out=redundancy)
+    return selected
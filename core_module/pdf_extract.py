@@ -0,0 +1,118 @@
+import os
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pypdf import PdfReader
+from langchain_core.documents import Document
+import core_module.config as config
+
+try:
+    from langchain_community.document_loaders.parsers.pdf import _purge_metadata
+except ImportError:
+    _purge_metadata = None
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def _worker_count(workers=None):
+    workers = workers if workers is not None else config.PDF_EXTRACT_WORKERS
+    return workers if workers and workers > 0 else (os.cpu_count() or 1)
+
+
+def _get_pool(workers):
+    # One long-lived pool per process. "spawn" avoids forking a threaded
+    # web server; its start-up cost is only paid once.
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+            logger.info(f"Started PDF extraction pool with {workers} workers")
+        return _pool
+
+
+def _document_metadata(reader, file_path):
+    # Same document-level metadata PyPDFLoader attaches to every page
+    metadata = {"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+    metadata.update(reader.metadata or {})
+    metadata.update({"source": file_path, "total_pages": len(reader.pages)})
+    if _purge_metadata is not None:
+        return _purge_metadata(metadata)
+    return {key.lstrip("/").lower(): str(value) if not isinstance(value, (int, float)) else value
+            for key, value in metadata.items()}
+
+
+def _extract_range(file_path, start, stop):
+    # Runs in a worker process (or inline for the serial path). Each page
+    # becomes (text, metadata) exactly as PyPDFLoader would produce it.
+    reader = PdfReader(file_path)
+    doc_metadata = _document_metadata(reader, file_path)
+    pages = []
+    for i in range(start, stop):
+        text = reader.pages[i].extract_text(extraction_mode="plain").strip()
+        pages.append((text, {**doc_metadata, "page": i, "page_label": reader.page_labels[i]}))
+    return pages
+
+
+def page_count(file_path):
+    return len(PdfReader(file_path).pages)
+
+
+def _page_ranges(num_pages, pages_per_task):
+    return [(start, min(start + pages_per_task, num_pages)) for start in range(0, num_pages, pages_per_task)]
+
+
+def iter_pdf_pages(file_path, workers=None, pages_per_task=None):
+    """
+    Yield a PDF's pages as Documents in page order.
+
+    Page ranges are fanned out over a process pool; only a bounded number of
+    ranges is in flight at once and results are yielded as soon as the next
+    range in order is ready. Small files (or workers=1) are parsed serially
+    with the same per-range function, so both paths produce identical output
+    (matching PyPDFLoader's page text and metadata).
+
+    Args:
+        file_path (str): Path of the PDF
+        workers (int, optional): Worker processes; defaults to config.PDF_EXTRACT_WORKERS
+        pages_per_task (int, optional): Pages per task; defaults to config.PDF_PAGES_PER_TASK
+    """
+    workers = _worker_count(workers)
+    pages_per_task = pages_per_task or config.PDF_PAGES_PER_TASK
+    num_pages = page_count(file_path)
+
+    if workers == 1 or num_pages < config.PDF_PARALLEL_MIN_PAGES:
+        for start, stop in _page_ranges(num_pages, pages_per_task):
+            for text, metadata in _extract_range(file_path, start, stop):
+                yield Document(page_content=text, metadata=metadata)
+        return
+
+    pool = _get_pool(workers)
+    ranges = deque(_page_ranges(num_pages, pages_per_task))
+    in_flight = deque()
+    max_in_flight = max(1, config.PDF_MAX_PAGES_IN_FLIGHT // pages_per_task)
+    logger.info(f"Extracting {num_pages} pages from {file_path} with {workers} workers")
+
+    try:
+        while ranges or in_flight:
+            while ranges and len(in_flight) < max_in_flight:
+                start, stop = ranges.popleft()
+                in_flight.append(pool.submit(_extract_range, file_path, start, stop))
+            for text, metadata in in_flight.popleft().result():
+                yield Document(page_content=text, metadata=metadata)
+    finally:
+        # The consumer stopped early or a range failed; drop queued work
+        for future in in_flight:
+            future.cancel()
+
+
+def extract_pdf_pages(file_path, workers=None, pages_per_task=None):
+    return list(iter_pdf_pages(file_path, workers, pages_per_task))
@@ -1,16 +1,33 @@
 import os
+import re
+import glob
+import json
+import shutil
+import hashlib
 import logging
-from langchain_groq import ChatGroq
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import chromadb
+import numpy as np
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains import create_retrieval_chain
 from langchain_community.vectorstores import Chroma
-from langchain_community.document_loaders import PyPDFDirectoryLoader, PyPDFLoader
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from dotenv import load_dotenv
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from core_module import config
+from core_module import ingest
+from core_module import clients
+from core_module import compaction
+from core_module import answer_cache
+from core_module import retrieval_cache
+from core_module import single_flight
+from core_module.embedding_cache import get_cached_embeddings
+from core_module.upload_store import file_sha256, get_upload_store
+from core_module.vector_manifest import VectorManifest
+from core_module.vector_index import ChromaIndex, FaissIndex
+from core_module.bm25 import BM25Index, chunk_key, reciprocal_rank_fusion
+from core_module.context_packer import pack_context, token_budget
+from core_module.mmr import mmr, query_relevance, score_relevance
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -33,6 +50,9 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 DOCUMENTS_DIR = os.path.join(current_dir, "documents")
 PERSIST_DIR = os.path.join(current_dir, "vector_db")
 
+# Uploads without a user id keep using the original (pre-partitioning) collection
+DEFAULT_COLLECTION = "langchain"
+
 # Create directories if they don't exist
 try:
     os.makedirs(DOCUMENTS_DIR, exist_ok=True)
@@ -42,20 +62,231 @@ except Exception as e:
     logger.error(f"Failed to create directories: {str(e)}")
     raise
 
+_client = None
+_vector_stores = {}
+_indexes = {}
+_lexical_indexes = {}
+_manifests = {}
+_services = {}
+_lock = threading.Lock()
+
+
+def collection_name(user_id=None):
+    """Chroma collection holding one user's documents."""
+    if not user_id:
+        return DEFAULT_COLLECTION
+    # Hashed rather than sanitized, so distinct user ids never share a
+    # collection; also keeps names within Chroma's [a-zA-Z0-9._-] charset
+    return "user_" + hashlib.sha256(str(user_id).encode("utf-8")).hexdigest()[:32]
+
+
+def legacy_collection_name(user_id):
+    # Collections were first named after the sanitized, truncated user id,
+    # which let distinct ids share one; see migrate_legacy_collections
+    return "user_" + re.sub(r"[^a-zA-Z0-9_-]", "_", str(user_id))[:50]
+
+
+def _manifest_path(collection):
+    # Each backend keeps its own manifest, since each has its own copy of the chunks
+    prefix = "" if config.VECTOR_BACKEND == "chroma" else f"{config.VECTOR_BACKEND}."
+    if collection == DEFAULT_COLLECTION:
+        return os.path.join(PERSIST_DIR, prefix + "manifest.json")
+    return os.path.join(PERSIST_DIR, f"{prefix}{collection}.manifest.json")
+
+
+def _get_client():
+    # Called with _lock held
+    global _client
+    if _client is None:
+        # One persistent client for every collection; it is thread-safe and
+        # writes through it are visible to every reader without reopening
+        # the directory
+        _client = chromadb.PersistentClient(path=PERSIST_DIR)
+        logger.info(f"Opened vector store at {PERSIST_DIR}")
+    return _client
+
+
+def get_shared_vector_store(user_id=None):
+    """Return the process-wide Chroma handle for a user's collection, opening it only once."""
+    collection = collection_name(user_id)
+    if collection not in _vector_stores:
+        with _lock:
+            if collection not in _vector_stores:
+                _vector_stores[collection] = Chroma(
+                    client=_get_client(),
+                    collection_name=collection,
+                    embedding_function=get_cached_embeddings(config.EMBED_MODEL)
+                )
+    return _vector_stores[collection]
+
+
+def get_vector_index(user_id=None):
+    """Return the process-wide vector index for a user's collection (config.VECTOR_BACKEND)."""
+    collection = collection_name(user_id)
+    if collection not in _indexes:
+        vector_store = get_shared_vector_store(user_id) if config.VECTOR_BACKEND == "chroma" else None
+        with _lock:
+            if collection not in _indexes:
+                if config.VECTOR_BACKEND == "faiss":
+                    _indexes[collection] = FaissIndex(os.path.join(PERSIST_DIR, "faiss", collection))
+                else:
+                    _indexes[collection] = ChromaIndex(vector_store, lambda: get_manifest(user_id))
+    return _indexes[collection]
+
+
+def get_lexical_index(user_id=None):
+    """Return the BM25 index for a user's collection, persisted next to the vector store."""
+    collection = collection_name(user_id)
+    if collection not in _lexical_indexes:
+        with _lock:
+            if collection not in _lexical_indexes:
+                _lexical_indexes[collection] = BM25Index(os.path.join(PERSIST_DIR, "bm25", f"{collection}.sqlite3"))
+    return _lexical_indexes[collection]
+
+
+def get_manifest(user_id=None):
+    """Return the manifest of documents and chunk counts in a user's collection."""
+    collection = collection_name(user_id)
+    if collection not in _manifests:
+        index = get_vector_index(user_id)
+        with _lock:
+            if collection not in _manifests:
+                # Stores created before the manifest are counted once
+                _manifests[collection] = VectorManifest(_manifest_path(collection), index.count)
+                return _manifests[collection]
+    manifest = _manifests[collection]
+    # Other worker processes may have ingested or deleted documents; the
+    # version feeds the answer and retrieval cache keys, so it must be current
+    manifest.refresh()
+    return manifest
+
+
+def _open_indexes():
+    with _lock:
+        return list(_indexes.values()) + list(_lexical_indexes.values())
+
+
+def get_qa_service(model_name=None, user_id=None):
+    """Return the long-lived QAModel for a (model, user), shared by all request threads."""
+    model_name = model_name if model_name in config.AVAILABLE_QA_MODELS else config.QA_MODEL
+    key = (model_name, collection_name(user_id))
+    # Deleted documents are compacted out of the indexes in the background
+    compaction.start_compactor(_open_indexes)
+    with _lock:
+        if key not in _services:
+            _services[key] = QAModel(model_name, user_id)
+        return _services[key]
+
+
+def is_document_referenced(doc_id):
+    """
+    Whether a stored upload is still needed: listed in any user's collection
+    (open or only on disk, for any backend) or read by a running summary or
+    report generation.
+    """
+    if single_flight.in_use(doc_id):
+        return True
+    with _lock:
+        loaded = dict(_manifests)
+    for manifest in loaded.values():
+        manifest.refresh()
+        if manifest.contains(doc_id):
+            return True
+    loaded_paths = {manifest.path for manifest in loaded.values()}
+    for path in glob.glob(os.path.join(PERSIST_DIR, "*manifest.json")):
+        if path in loaded_paths:
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                if doc_id in json.load(f).get("documents", {}):
+                    return True
+        except (OSError, ValueError) as e:
+            # Unreadable manifests count as referencing it, so the file is kept
+            logger.warning(f"Could not read manifest {path}: {str(e)}")
+            return True
+    return False
+
+
+def migrate_legacy_collections(user_ids):
+    """
+    Move documents out of collections named with legacy_collection_name().
+
+    The old names cannot be mapped back to user ids, so the ids are passed
+    in (e.g. every user_id in the users table). Each legacy collection's
+    documents are re-ingested from the upload store into the owner's hashed
+    collection (the embedding cache makes this cheap), then the legacy
+    collection is dropped for the current backend, with its BM25 index once
+    no backend lists it any more. A legacy name that several of the given
+    ids map to may mix their documents, so it is left alone and reported,
+    as is one whose stored files are missing. Run it while the API is
+    stopped.
+
+    Args:
+        user_ids (iterable): Ids of the users who may own a legacy collection
+
+    Returns:
+        dict: Counts of collections migrated, documents re-ingested, and
+              collections skipped as ambiguous or incomplete
+    """
+    counts = {"migrated": 0, "documents": 0, "ambiguous": 0, "incomplete": 0}
+    owners = {}
+    for user_id in user_ids:
+        if user_id:
+            owners.setdefault(legacy_collection_name(user_id), set()).add(str(user_id))
+    store = get_upload_store()
+    for legacy, ids in sorted(owners.items()):
+        manifest_path = _manifest_path(legacy)
+        if not os.path.exists(manifest_path):
+            continue
+        if len(ids) > 1:
+            logger.warning(f"Not migrating {legacy}: {len(ids)} user ids map to it")
+            counts["ambiguous"] += 1
+            continue
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            documents = json.load(f).get("documents", {})
+        qa_model = QAModel(user_id=next(iter(ids)))
+        missing = [doc_id for doc_id in documents if not store.exists(doc_id)]
+        for doc_id in documents:
+            if doc_id not in missing:
+                qa_model.process_uploaded_file(store.path_for(doc_id))
+                counts["documents"] += 1
+        if missing:
+            logger.warning(f"Keeping {legacy}: {len(missing)} stored files are missing")
+            counts["incomplete"] += 1
+            continue
+
+        if config.VECTOR_BACKEND == "faiss":
+            shutil.rmtree(os.path.join(PERSIST_DIR, "faiss", legacy), ignore_errors=True)
+        else:
+            with _lock:
+                client = _get_client()
+            if legacy in [getattr(c, "name", c) for c in client.list_collections()]:
+                client.delete_collection(legacy)
+        os.remove(manifest_path)
+        if not glob.glob(os.path.join(PERSIST_DIR, f"*{legacy}.manifest.json")):
+            bm25_path = os.path.join(PERSIST_DIR, "bm25", f"{legacy}.sqlite3")
+            for path in (bm25_path, bm25_path + "-wal", bm25_path + "-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+        counts["migrated"] += 1
+    logger.info(f"Migrated legacy collections: {counts}")
+    return counts
+
+
 class QAModel:
-    def __init__(self, model_name=None):
-        self.vector_store = None
+    def __init__(self, model_name=None, user_id=None):
         self.qa_model = model_name if model_name in config.AVAILABLE_QA_MODELS else config.QA_MODEL
+        self.user_id = user_id
+        self._document_chain = None
+        self._chain_lock = threading.Lock()
         logger.info("Initialized QAModel")
 
     # Initialize LLM
     def get_llm(self):
         try:
-            llm = ChatGroq(
-                groq_api_key=GROQ_API_KEY,
-                model_name=self.qa_model
-            )
-            logger.info(f"Initialized LLM with model: {self.qa_model}")
+            # One shared client (and connection pool) per model for the whole process
+            llm = clients.get_chat_model("groq", self.qa_model)
+            logger.info(f"Using LLM with model: {self.qa_model}")
             return llm
         except Exception as e:
             logger.error(f"Failed to initialize LLM: {str(e)}")
@@ -93,7 +324,8 @@ class QAModel:
     # Create embeddings model
     def get_embeddings(self):
         try:
-            embeddings = GoogleGenerativeAIEmbeddings(model=config.EMBED_MODEL)
+            # Shared client backed by the on-disk embedding cache
+            embeddings = get_cached_embeddings(config.EMBED_MODEL)
             logger.info(f"Initialized embeddings model: {config.EMBED_MODEL}")
             return embeddings
         except Exception as e:
@@ -110,46 +342,38 @@ class QAModel:
                 raise FileNotFoundError(f"File not found: {file_path}")
                 
             logger.info(f"Processing uploaded file: {file_path}")
-            loader = PyPDFLoader(file_path)
-            documents = loader.load()
-            logger.info(f"Loaded document with {len(documents)} pages")
-            
-            if len(documents) == 0:
-                logger.warning("No content found in document")
-                return None
-                
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=config.QA_CHUNK_SIZE, chunk_overlap=config.QA_CHUNK_OVERLAP)
-            split_documents = text_splitter.split_documents(documents)
-            logger.info(f"Split document into {len(split_documents)} chunks")
-            
-            if len(split_documents) == 0:
+            embeddings = self.get_embeddings()
+            index = self.get_vector_index()
+            lexical_index = get_lexical_index(self.user_id)
+            manifest = get_manifest(self.user_id)
+
+            # Documents are keyed by content hash; re-uploads are already indexed
+            file_hash = file_sha256(file_path)
+            if manifest.contains(file_hash):
+                logger.info(f"Document {file_hash} is already in the vector store")
+                return index
+
+            # Pages are parsed, split, embedded and written batch by batch, so
+            # memory stays bounded however long the document is
+            chunk_count = ingest.ingest_document(
+                file_path,
+                embeddings,
+                ingest.index_writer(file_hash, index, lexical_index),
+                config.QA_CHUNK_SIZE,
+                config.QA_CHUNK_OVERLAP,
+                file_hash=file_hash
+            )
+            logger.info(f"Stored {chunk_count} chunks in the vector store")
+
+            if chunk_count == 0:
                 logger.warning("No text chunks extracted from document")
                 return None
-                
-            embeddings = self.get_embeddings()
-            
-            # Get existing vector store or create new one
-            if os.path.exists(PERSIST_DIR) and os.listdir(PERSIST_DIR):
-                logger.info("Loading existing vector store")
-                vector_store = Chroma(
-                    persist_directory=PERSIST_DIR,
-                    embedding_function=embeddings
-                )
-                # Add new documents to existing store
-                vector_store.add_documents(split_documents)
-                logger.info("Added new documents to existing vector store")
-            else:
-                logger.info("Creating new vector store")
-                vector_store = Chroma.from_documents(
-                    documents=split_documents,
-                    embedding=embeddings,
-                    persist_directory=PERSIST_DIR
-                )
-            
-            vector_store.persist()
-            self.vector_store = vector_store
+
+            index.persist()
+            lexical_index.persist()
+            manifest.add_document(file_hash, chunk_count, filename=os.path.basename(file_path))
             logger.info("Successfully processed and stored document")
-            return vector_store
+            return index
         except Exception as e:
             logger.error(f"Failed to process uploaded file: {str(e)}")
             raise
@@ -157,73 +381,366 @@ class QAModel:
     # Check if vector store has documents
     def has_documents(self):
         try:
-            vector_store = self.get_vector_store()
-            if vector_store is None:
-                return False
-                
-            # A simple query to check if there are any documents
-            results = vector_store.similarity_search("test", k=1)
-            return len(results) > 0
+            # In-memory lookup; no embedding call or vector search
+            return get_manifest(self.user_id).has_documents()
         except Exception:
             return False
 
     # Get vector store
     def get_vector_store(self):
         try:
-            if self.vector_store is not None:
-                logger.info("Using cached vector store")
-                return self.vector_store
-                
-            embeddings = self.get_embeddings()
-            
-            # If vector store exists, load it
-            if os.path.exists(PERSIST_DIR) and os.listdir(PERSIST_DIR):
-                logger.info("Loading existing vector store")
-                vector_store = Chroma(
-                    persist_directory=PERSIST_DIR,
-                    embedding_function=embeddings
-                )
-            else:
-                # Create new if it doesn't exist
-                logger.info("Creating new vector store from directory")
-                vector_store = self.process_directory_documents()
-                if vector_store is None:
-                    logger.warning("No documents to process. Vector store not created.")
-                    return None
-            
-            self.vector_store = vector_store
-            return vector_store
+            # Opened once per process and shared by every QAModel of this user
+            return get_shared_vector_store(self.user_id)
         except Exception as e:
             logger.error(f"Failed to get vector store: {str(e)}")
             return None
 
+    # Get the vector index used for retrieval (Chroma or FAISS, see config.VECTOR_BACKEND)
+    def get_vector_index(self):
+        try:
+            return get_vector_index(self.user_id)
+        except Exception as e:
+            logger.error(f"Failed to get vector index: {str(e)}")
+            return None
+
+    # List the documents in this user's collection
+    def list_documents(self):
+        return get_manifest(self.user_id).list_documents()
+
+    # Remove a document's chunks from this user's collection
+    def delete_document(self, doc_id):
+        try:
+            manifest = get_manifest(self.user_id)
+            if not manifest.contains(doc_id):
+                return False
+            # Chunks are tombstoned now (so they are never retrieved again)
+            # and compacted out of the indexes later in the background
+            index = self.get_vector_index()
+            lexical_index = get_lexical_index(self.user_id)
+            removed = index.delete_document(doc_id)
+            lexical_index.delete_document(doc_id)
+            index.persist()
+            lexical_index.persist()
+            manifest.remove_document(doc_id)
+            compaction.notify()
+            logger.info(f"Deleted document {doc_id} ({removed} chunks)")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to delete document: {str(e)}")
+            raise
+
+    # Embed questions, reusing embeddings of earlier identical questions and
+    # sending the rest in one batched request
+    def embed_queries(self, queries):
+        vectors = [retrieval_cache.get_vector(query) for query in queries]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if len(missing) == 1:
+            vectors[missing[0]] = self.get_embeddings().embed_query(queries[missing[0]])
+        elif missing:
+            computed = self.get_embeddings().embed_queries([queries[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        for i in missing:
+            retrieval_cache.put_vector(queries[i], vectors[i])
+        return vectors
+
+    def embed_query(self, query):
+        return self.embed_queries([query])[0]
+
+    # Retrieve the k best chunks for a query with the given retrieval mode
+    def retrieve(self, query, k=4, document_ids=None, mode=None, query_vector=None):
+        query_vectors = [query_vector] if query_vector is not None else None
+        return self.retrieve_batch([query], k, document_ids, mode, query_vectors)[0]
+
+    # Retrieve for several questions at once: one embedding request and one
+    # vector search over the matrix of query vectors
+    def retrieve_batch(self, queries, k=4, document_ids=None, mode=None, query_vectors=None):
+        mode = mode if mode in config.AVAILABLE_RETRIEVAL_MODES else config.RETRIEVAL_MODE
+        # Repeat questions against an unchanged collection skip embedding
+        # and search; the manifest version moves on every ingest and delete
+        fetch_k = max(k * config.QA_MMR_FETCH_FACTOR, config.QA_MMR_FETCH_K) if config.QA_USE_MMR else k
+        scope = (collection_name(self.user_id), mode, k, tuple(sorted(document_ids or ())),
+                 fetch_k, config.QA_MMR_LAMBDA if config.QA_USE_MMR else None)
+        version = get_manifest(self.user_id).version
+        results = [retrieval_cache.get_results(query, scope, version) for query in queries]
+        misses = [i for i, documents in enumerate(results) if documents is None]
+        if not misses:
+            return results
+
+        candidates = max(fetch_k, config.RETRIEVAL_CANDIDATES)
+        lexical = {}
+        dense_needed = []
+        for i in misses:
+            if mode != "dense":
+                documents, confidence = get_lexical_index(self.user_id).search(queries[i], candidates, document_ids)
+                if mode == "fast" and documents and confidence >= config.BM25_FAST_PATH_CONFIDENCE:
+                    # The top chunk has every important query term, the terms
+                    # are specific and it clearly beats the runner-up; answer
+                    # from BM25 alone without a query embedding
+                    logger.info(f"BM25 fast path (confidence {confidence:.2f})")
+                    results[i] = documents[:k]
+                    continue
+                lexical[i] = documents
+            dense_needed.append(i)
+
+        if dense_needed:
+            # Embed each question exactly once (or reuse the caller's
+            # embeddings) and search by vector
+            if query_vectors is None:
+                vectors = self.embed_queries([queries[i] for i in dense_needed])
+            else:
+                vectors = [query_vectors[i] for i in dense_needed]
+            # One depth for the whole batch, so a question's results do not
+            # depend on which other questions it was asked with; dense-only
+            # lists are cut back to fetch_k below
+            depth = fetch_k if mode == "dense" else candidates
+            dense = self.get_vector_index().search_batch(vectors, depth, document_ids)
+            ranked = []
+            relevances = []
+            for i, documents in zip(dense_needed, dense):
+                if lexical.get(i):
+                    fused = reciprocal_rank_fusion([documents, lexical[i]], with_scores=True)[:fetch_k]
+                    ranked.append([document for document, _ in fused])
+                    relevances.append(score_relevance([score for _, score in fused]))
+                else:
+                    ranked.append(documents[:fetch_k])
+                    relevances.append(None)
+            for i, documents in zip(dense_needed, self._diversify(ranked, relevances, vectors, k)):
+                results[i] = documents
+
+        for i in misses:
+            retrieval_cache.put_results(queries[i], scope, version, results[i])
+        return results
+
+    # Re-rank each query's over-fetched candidates with maximal marginal
+    # relevance, so near-duplicate chunks from one section do not crowd out
+    # the rest of the paper
+    def _diversify(self, ranked, relevances, query_vectors, k):
+        if not config.QA_USE_MMR or all(len(documents) <= k for documents in ranked):
+            return [documents[:k] for documents in ranked]
+        # The vectors stored in the index, fetched in one lookup; chunks
+        # without one (indexed before chunk ids existed) are not compared
+        # with the others
+        keys = list(dict.fromkeys(chunk_key(doc) for documents in ranked for doc in documents))
+        vectors = dict(zip(keys, self.get_vector_index().get_vectors(keys)))
+        diversified = []
+        for documents, relevance, query_vector in zip(ranked, relevances, query_vectors):
+            if len(documents) <= k:
+                diversified.append(documents)
+                continue
+            candidates = [vectors[chunk_key(doc)] for doc in documents]
+            missing = [vector is None for vector in candidates]
+            dimension = next((len(vector) for vector in candidates if vector is not None), 0)
+            candidates = [np.zeros(dimension) if vector is None else vector for vector in candidates]
+            if relevance is None:
+                # Dense results: query similarity, as in standard MMR. Chunks
+                # without a vector keep the relevance of the one ranked above
+                relevance = query_relevance(query_vector, candidates)
+                for j in range(len(relevance)):
+                    if missing[j]:
+                        relevance[j] = relevance[j - 1] if j else 1.0
+            selected = mmr(query_vector, candidates, k, relevance=relevance)
+            diversified.append([documents[j] for j in selected])
+        return diversified
+
+    # Built once per service; invoking it is thread-safe
+    def get_document_chain(self):
+        with self._chain_lock:
+            if self._document_chain is None:
+                self._document_chain = create_stuff_documents_chain(self.get_llm(), self.get_prompt())
+            return self._document_chain
+
+    # Check that there is something to search; returns (error message, document_ids)
+    def _check_documents(self, document_ids):
+        # Check if we have documents first
+        index = self.get_vector_index()
+        if index is None:
+            return "No documents available. Please upload PDF documents first.", document_ids
+        
+        # Check if vector store has documents
+        if not self.has_documents():
+            return "Vector database appears empty. Please upload PDF documents first.", document_ids
+
+        # Restrict the search to the chosen documents (by content hash)
+        if document_ids:
+            manifest = get_manifest(self.user_id)
+            document_ids = [doc_id for doc_id in document_ids if manifest.contains(doc_id)]
+            if not document_ids:
+                return "None of the selected documents were found. Please upload them first.", document_ids
+        return None, document_ids
+
+    def _answer_cache_key(self, mode, document_ids):
+        return (collection_name(self.user_id), self.qa_model, mode, tuple(sorted(document_ids or ())))
+
     # Answer questions from documents
-    def answer_question(self, query):
+    def answer_question(self, query, document_ids=None, mode=None, use_cache=True):
         try:
             logger.info(f"Processing question: {query}")
+
+            error, document_ids = self._check_documents(document_ids)
+            if error:
+                return error
             
-            # Check if we have documents first
-            vector_store = self.get_vector_store()
-            if vector_store is None:
-                return "No documents available. Please upload PDF documents first."
-            
-            # Check if vector store has documents
-            if not self.has_documents():
-                return "Vector database appears empty. Please upload PDF documents first."
-            
-            llm = self.get_llm()
-            prompt = self.get_prompt()
-            
-            document_chain = create_stuff_documents_chain(llm, prompt)
-            retriever = vector_store.as_retriever(search_kwargs={"k": 4})
-            retrieval_chain = create_retrieval_chain(retriever, document_chain)
+            mode = mode if mode in config.AVAILABLE_RETRIEVAL_MODES else config.RETRIEVAL_MODE
+            started = time.time()
+
+            # Repeated or semantically equivalent questions about an
+            # unchanged document set reuse the earlier answer instead of
+            # calling the LLM. Exact repeats need no embedding; the fast mode
+            # embeds only when BM25 is not confident, so it checks for
+            # similar questions after retrieval, with that embedding.
+            query_vector = None
+            if use_cache:
+                version = get_manifest(self.user_id).version
+                cache_key = self._answer_cache_key(mode, document_ids)
+                if mode != "fast":
+                    query_vector = self.embed_query(query)
+                cached = answer_cache.get(cache_key, version, query, query_vector)
+                if cached is not None:
+                    return cached
+
+            documents = self.retrieve(query, config.QA_CONTEXT_CHUNKS, document_ids, mode, query_vector)
+            if use_cache and mode == "fast":
+                query_vector = retrieval_cache.get_vector(query)
+                if query_vector is not None:
+                    cached = answer_cache.get(cache_key, version, query, query_vector)
+                    if cached is not None:
+                        return cached
+
+            document_chain = self.get_document_chain()
             
             start = time.process_time()
-            response = retrieval_chain.invoke({'input': query})
+            # Overlapping chunks are merged, repeats dropped and the context
+            # capped at the model's token budget
+            context = pack_context(documents, token_budget(self.qa_model))
+            answer = document_chain.invoke({'input': query, 'context': context})
             processing_time = time.process_time() - start
             
             logger.info(f"Question answered in {processing_time:.2f} seconds")
-            return response['answer']
+            if use_cache:
+                answer_cache.put(cache_key, version, query_vector, query, answer, time.time() - started)
+            return answer
         except Exception as e:
             logger.error(f"Failed to answer question: {str(e)}")
-            return f"An error occurred while processing your question: {str(e)}"
\ No newline at end of file
+            return f"An error occurred while processing your question: {str(e)}"
+
+    # Yield the cached answers among positions, to every position asking the
+    # same question (groups), adding them to answered; returns the positions
+    # left unanswered
+    def _cached_answers(self, cache_key, version, queries, query_vectors, positions, groups, answered):
+        unanswered = []
+        for position in positions:
+            cached = answer_cache.get(cache_key, version, queries[position], query_vectors[position])
+            if cached is not None:
+                for duplicate in groups[position]:
+                    answered.add(duplicate)
+                    yield duplicate, cached
+            else:
+                unanswered.append(position)
+        return unanswered
+
+    # Answer several questions, yielding (position, answer) as each finishes
+    def answer_questions(self, queries, document_ids=None, mode=None, use_cache=True):
+        """
+        Answer a batch of questions with shared retrieval.
+
+        The questions are embedded in one request and searched in one
+        vectorized call; the LLM calls then run concurrently, at most
+        QA_BATCH_MAX_CONCURRENCY at a time. A question asked more than once
+        in the batch is answered once and the answer yielded for every
+        position. Errors are reported per question, like answer_question does.
+        """
+        logger.info(f"Processing batch of {len(queries)} questions")
+        # Cached answers are yielded as they are found; a failure afterwards
+        # is reported only for the questions that are still unanswered
+        answered = set()
+        try:
+            error, document_ids = self._check_documents(document_ids)
+            if error:
+                for position in range(len(queries)):
+                    yield position, error
+                return
+
+            mode = mode if mode in config.AVAILABLE_RETRIEVAL_MODES else config.RETRIEVAL_MODE
+            started = time.time()
+            version = get_manifest(self.user_id).version
+            cache_key = self._answer_cache_key(mode, document_ids)
+
+            # Repeats within the batch (same normalized text, as the answer
+            # cache matches them) are grouped under their first position,
+            # which alone is embedded, retrieved and sent to the LLM
+            groups = {}
+            first = {}
+            for position, query in enumerate(queries):
+                groups.setdefault(first.setdefault(retrieval_cache.normalize_query(query), position), []).append(position)
+
+            # Exact repeats first, without embedding anything; then, except
+            # in the fast mode (see answer_question), similar questions
+            pending = list(groups)
+            query_vectors = [None] * len(queries)
+
+            def cached_answers(positions):
+                return self._cached_answers(cache_key, version, queries, query_vectors, positions, groups, answered)
+
+            if use_cache:
+                pending = yield from cached_answers(pending)
+            if pending and mode != "fast":
+                for position, vector in zip(pending, self.embed_queries([queries[i] for i in pending])):
+                    query_vectors[position] = vector
+                if use_cache:
+                    pending = yield from cached_answers(pending)
+            if not pending:
+                return
+
+            vectors = None if mode == "fast" else [query_vectors[i] for i in pending]
+            contexts = dict(zip(pending, self.retrieve_batch(
+                [queries[i] for i in pending], config.QA_CONTEXT_CHUNKS, document_ids, mode, vectors
+            )))
+            if use_cache and mode == "fast":
+                for position in pending:
+                    query_vectors[position] = retrieval_cache.get_vector(queries[position])
+                embedded = [i for i in pending if query_vectors[i] is not None]
+                yield from cached_answers(embedded)
+                pending = [i for i in pending if i not in answered]
+                if not pending:
+                    return
+            contexts = [pack_context(contexts[i], token_budget(self.qa_model)) for i in pending]
+            document_chain = self.get_document_chain()
+        except Exception as e:
+            logger.error(f"Failed to answer questions: {str(e)}")
+            for position in range(len(queries)):
+                if position not in answered:
+                    yield position, f"An error occurred while processing your question: {str(e)}"
+            return
+
+        executor = ThreadPoolExecutor(max_workers=min(config.QA_BATCH_MAX_CONCURRENCY, len(pending)))
+        try:
+            futures = {
+                executor.submit(document_chain.invoke, {'input': queries[position], 'context': context}): position
+                for position, context in zip(pending, contexts)
+            }
+            for future in as_completed(futures):
+                position = futures[future]
+                try:
+                    answer = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to answer question: {str(e)}")
+                    answer = f"An error occurred while processing your question: {str(e)}"
+                else:
+                    if use_cache:
+                        answer_cache.put(cache_key, version, query_vectors[position], queries[position], answer,
+                                         time.time() - started)
+                for duplicate in groups[position]:
+                    yield duplicate, answer
+        finally:
+            # Closing the generator (e.g. the SSE client went away) must not
+            # wait for the LLM calls still queued or running
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    # "python -m core_module.qa_model USER_ID..." moves the given users'
+    # documents out of collections with legacy names
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    print(migrate_legacy_collections(sys.argv[1:]))
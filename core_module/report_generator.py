@@ -1,78 +1,115 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.document_transformers import EmbeddingsClusteringFilter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.document_loaders import TextLoader, Docx2txtLoader
 import core_module.config as config
-import os
+from core_module import clients
+from core_module import document_cache, result_cache, single_flight
+from core_module.disk_cache import make_key
+from core_module.embedding_cache import get_cached_embeddings
+from core_module.section_selector import choose_sections
+from core_module.streaming import iter_llm_text
+from core_module.markdown_stream import normalize_stream
+from core_module.upload_store import file_sha256
+
+# Bump whenever the prompt changes so cached reports are regenerated
+REPORT_PROMPT_VERSION = 1
 
 
 class ReportGenerator:
-    def __init__(self, model_name=None):
+    def __init__(self, model_name=None, selection_strategy=None):
         self.chunk_size = config.REPORT_CHUNK_SIZE
         self.chunk_overlap = config.REPORT_CHUNK_OVERLAP
         self.report_llm = model_name if model_name in config.AVAILABLE_REPORT_MODELS else config.REPORT_MODEL
         self.embed_model = config.EMBED_MODEL
+        self.selection_strategy = selection_strategy if selection_strategy in config.AVAILABLE_SELECTION_STRATEGIES else config.SECTION_SELECTION_STRATEGY
+        self.last_metadata = {}
 
     def extractText(self, file_path):
-        # Detect file type by extension
-        file_extension = file_path.lower().split('.')[-1]
-
-        if file_extension == 'pdf':
-            loader = PyPDFLoader(file_path)
-        elif file_extension == 'docx':
-            loader = Docx2txtLoader(file_path)
-        elif file_extension == 'txt':
-            loader = TextLoader(file_path)
-        else:
-            raise ValueError(f"Unsupported file type: {file_extension}. Supported types are pdf, docx, and txt.")
-
-        pages = loader.load()
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,
-            separators=["\n\n", "\n", " ", ""]
+        # Parsed pages and chunks are cached by file hash, so the other
+        # features reuse this work for the same document
+        return document_cache.load_chunks(file_path, self.chunk_size, self.chunk_overlap)
+
+    def generate_report(self, file_path, use_cache=True):
+        # Yields report chunks as they are generated; errors become a final message
+        try:
+            report_chunks = []
+            for chunk in self.stream_report(file_path, use_cache):
+                report_chunks.append(chunk)
+                yield chunk
+
+            print(f"\n[ReportGenerator] Report generation complete.")
+
+            # Return the complete report for saving
+            return "".join(report_chunks)
+
+        except Exception as e:
+            error_message = f"Error during report generation: {str(e)}"
+            print(f"[ReportGenerator] ERROR: {error_message}")
+            yield error_message
+            return error_message
+
+    def stream_report(self, file_path, use_cache=True):
+        """Yield report tokens as the LLM produces them; errors are raised to the caller."""
+        # Identical concurrent requests share one pipeline run and its token stream
+        file_hash = file_sha256(file_path)
+        key = make_key("report", file_hash, self.report_llm, self.selection_strategy, use_cache)
+        # The stored file is kept while the run that reads it is in flight
+        flight, leader = single_flight.join(
+            key,
+            lambda: self._generate_report(file_path, use_cache),
+            lambda: self.last_metadata,
+            resources=(file_hash,)
+        )
+        if not leader:
+            print(f"[ReportGenerator] Joining in-flight report generation")
+        yield from flight.tokens()
+        self.last_metadata = {**flight.metadata, "coalesced": not leader}
+
+    def _generate_report(self, file_path, use_cache):
+        # Everything in the key is known before the document is parsed, so a
+        # cached report is returned without extracting or chunking anything
+        key = result_cache.result_key(
+            "report", REPORT_PROMPT_VERSION, file_sha256(file_path), self.report_llm,
+            self.chunk_size, self.chunk_overlap, self._cache_settings()
         )
-        texts = text_splitter.split_documents(pages)
-        return texts
+        if use_cache:
+            cached = result_cache.get(key)
+            if cached is not None:
+                print(f"[ReportGenerator] Returning cached report")
+                self.last_metadata = {**cached["metadata"], "cached": True}
+                yield from result_cache.iter_cached_text(cached["text"])
+                return
 
-    def generate_report(self, file_path):
         # Extract the document
         print(f"[ReportGenerator] Extracting text from {file_path}")
         texts = self.extractText(file_path)
         doc_length = len(texts)
         print(f"[ReportGenerator] Document split into {doc_length} chunks")
 
+        params = self._generation_params(doc_length)
+
         # Dynamically adjust parameters based on document length
         dynamic_clusters = min(max(3, doc_length // 5), 10)  # Between 3-10 clusters
         print(f"[ReportGenerator] Using {dynamic_clusters} clusters for document processing")
 
-        # In the summarizer method, change how you initialize the LLM
-        llm = ChatGoogleGenerativeAI(
-            model=self.report_llm,
-            temperature=0.1,
-            top_p=max(0.7, min(0.9, 0.7 + (doc_length / 100) * 0.2)),
-            max_output_tokens=min(4096, max(1024, doc_length * 100)),
-            google_api_key=os.environ.get("GOOGLE_API_KEY")
+        # Shared client per model; sampling parameters are per request
+        llm = clients.get_chat_model(
+            "google",
+            self.report_llm,
+            temperature=params["temperature"],
+            top_p=params["top_p"],
+            max_output_tokens=params["max_output_tokens"]
         )
-        embeddings = GoogleGenerativeAIEmbeddings(model=self.embed_model)
+        # The local strategy needs no embedding calls at all
+        embeddings = get_cached_embeddings(self.embed_model) if self.selection_strategy == "embedding" else None
         print(f"[ReportGenerator] LLM initialized with model: {self.report_llm}")
 
-        # Create the filter with dynamic clusters
-        filter = EmbeddingsClusteringFilter(
-            embeddings=embeddings,
-            num_clusters=min(dynamic_clusters, max(2, len(texts) // 2))  # Ensure at least 2 clusters
-        )
+        num_clusters = min(dynamic_clusters, max(2, len(texts) // 2))  # Ensure at least 2 clusters
 
-        try:
-            # Transform documents using the filter
-            print(f"[ReportGenerator] Clustering document chunks...")
-            result = filter.transform_documents(documents=texts)
-            print(f"[ReportGenerator] Clustering complete. Processing {len(result)} sections")
+        # Pick the chunk closest to each k-means centroid, in document order
+        print(f"[ReportGenerator] Clustering document chunks ({self.selection_strategy} selection)...")
+        result = choose_sections(texts, num_clusters, self.selection_strategy, embeddings)
+        print(f"[ReportGenerator] Clustering complete. Processing {len(result)} sections")
 
-            # Prepare prompt for direct streaming
-            prompt = f"""You are a professional research report generator. Your task is to create a comprehensive, well-structured report based on the provided research document sections.
+        # Prepare prompt for direct streaming
+        prompt = f"""You are a professional research report generator. Your task is to create a comprehensive, well-structured report based on the provided research document sections.
 
 Guidelines for the report:
 1. Structure the report with clear sections:
@@ -107,44 +144,42 @@ Guidelines for the report:
 Here are the document sections to analyze:
 
 """
-                
-            for i, doc in enumerate(result):
-                prompt += f"Section {i + 1}:\n{doc.page_content}\n\n"
-
-            print(f"[ReportGenerator] Prompt prepared. Sending to LLM...")
-            
-            # Get all the chunks first in a buffer
-            content_chunks = []
-            # Stream directly from the LLM but just collect chunks
-            for chunk in llm.stream(prompt):
-                # Extract just the text content from the response
-                chunk_text = ""
-                if isinstance(chunk, dict) and 'content' in chunk:
-                    chunk_text = chunk['content']
-                elif hasattr(chunk, 'content'):
-                    chunk_text = chunk.content
-                elif isinstance(chunk, str):
-                    chunk_text = chunk
-
-                # Store the chunk
-                if chunk_text:
-                    content_chunks.append(chunk_text)
-            
-            # Now assemble the full report
-            complete_report = "".join(content_chunks)
-            
-            # Log completion AFTER all content has been collected
-            print(f"\n[ReportGenerator] Report generation complete.")
             
-            # Now yield all chunks
-            for chunk in content_chunks:
-                yield chunk
-                
-            # Return the complete summary for saving
-            return complete_report
-
-        except Exception as e:
-            error_message = f"Error during report generation: {str(e)}"
-            print(f"[ReportGenerator] ERROR: {error_message}")
-            yield error_message
-            return error_message
\ No newline at end of file
+        for i, doc in enumerate(result):
+            prompt += f"Section {i + 1}:\n{doc.page_content}\n\n"
+
+        self.last_metadata = {
+            "model_used": self.report_llm,
+            "chunks": doc_length,
+            "sections": len(result),
+            "mode": self.selection_strategy,
+            "params": params,
+            "cached": False,
+        }
+        print(f"[ReportGenerator] Prompt prepared. Sending to LLM...")
+
+        # Forward tokens as they arrive instead of buffering the whole report;
+        # markdown is fixed up incrementally on the way through
+        report_parts = []
+        for token in normalize_stream(iter_llm_text(llm, prompt)):
+            report_parts.append(token)
+            yield token
+
+        # Only complete generations are cached
+        result_cache.put(key, "".join(report_parts), self.last_metadata)
+
+    def _cache_settings(self):
+        # Everything besides the model, document and chunking that shapes the
+        # output; the length-based parameters follow from these and the document
+        return {
+            "selection": self.selection_strategy,
+            "seed": config.SECTION_SELECTOR_SEED,
+        }
+
+    def _generation_params(self, doc_length):
+        # Sampling parameters scale with the document length
+        return {
+            "temperature": 0.1,
+            "top_p": max(0.7, min(0.9, 0.7 + (doc_length / 100) * 0.2)),
+            "max_output_tokens": min(4096, max(1024, doc_length * 100)),
+        }
@@ -0,0 +1,77 @@
+import os
+import time
+import logging
+import threading
+import core_module.config as config
+from core_module.disk_cache import DiskCache, CACHE_ROOT, make_key
+
+logger = logging.getLogger(__name__)
+
+# Finished summaries and reports, one JSON entry per generation key. Entries
+# carry their creation time so expired ones are dropped on read; the
+# directory size is bounded by least-recently-used eviction.
+_cache = DiskCache(
+    os.path.join(CACHE_ROOT, "results"),
+    max_bytes=config.RESULT_CACHE_MAX_MB * 1024 * 1024,
+    suffix=".json",
+)
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0}
+
+# Cached results are replayed in pieces of this many characters so cache
+# hits keep the same streaming shape as a live generation
+REPLAY_CHUNK_CHARS = 512
+
+
+def result_key(operation, prompt_version, file_hash, model, chunk_size, chunk_overlap, params):
+    """
+    Build the cache key for one generation.
+
+    Args:
+        operation (str): "summary" or "report"
+        prompt_version (int): Bumped whenever the operation's prompts change
+        file_hash (str): sha256 of the source document
+        model (str): LLM name
+        chunk_size, chunk_overlap (int): Chunk settings
+        params (dict): Selection and prompt settings known before the
+            document is chunked (the cached entry records the sampling
+            parameters derived from its length)
+    """
+    return make_key(operation, prompt_version, file_hash, model, chunk_size, chunk_overlap, params)
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def get(key):
+    """Return the cached {"text", "metadata"} for key, or None if missing or expired."""
+    entry = _cache.get_json(key)
+    if entry is None:
+        _count("misses")
+        return None
+    if time.time() - entry.get("created", 0) > config.RESULT_CACHE_TTL_HOURS * 3600:
+        _cache.delete(key)
+        _count("expired")
+        _count("misses")
+        return None
+    _count("hits")
+    return entry
+
+
+def put(key, text, metadata):
+    _cache.set_json(key, {"created": time.time(), "text": text, "metadata": metadata})
+    _count("stores")
+
+
+def iter_cached_text(text):
+    for start in range(0, len(text), REPLAY_CHUNK_CHARS):
+        yield text[start:start + REPLAY_CHUNK_CHARS]
+
+
+def stats():
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {**_stats, "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0}
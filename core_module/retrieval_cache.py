@@ -0,0 +1,117 @@
+import re
+import logging
+import threading
+from collections import OrderedDict
+import core_module.config as config
+
+logger = logging.getLogger(__name__)
+
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """Case, whitespace and trailing punctuation do not change retrieval."""
+    return _SPACE.sub(" ", query).strip().rstrip("?!. ").lower()
+
+
+class RetrievalCache:
+    """
+    LRU cache of query embeddings and top-k retrieval results.
+
+    Entries are keyed by the normalized question. Each holds the question's
+    embedding (valid forever) and the retrieved chunks per retrieval scope
+    (collection, mode, k, document filter), stamped with the collection's
+    manifest version. Ingesting or deleting a document bumps the version,
+    which retires the results but keeps the embedding.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or config.QA_RETRIEVAL_CACHE_MAX_ENTRIES
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.vector_hits = 0
+        self.vector_misses = 0
+
+    def _entry(self, query, create=False):
+        key = normalize_query(query)
+        entry = self._entries.get(key)
+        if entry is None and create:
+            entry = self._entries[key] = {"vector": None, "results": {}}
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def get_vector(self, query):
+        with self._lock:
+            entry = self._entry(query)
+            if entry is None or entry["vector"] is None:
+                self.vector_misses += 1
+                return None
+            self.vector_hits += 1
+            return entry["vector"]
+
+    def put_vector(self, query, vector):
+        with self._lock:
+            self._entry(query, create=True)["vector"] = vector
+
+    def get_results(self, query, scope, version):
+        """Return the cached Documents for (query, scope) at this version, or None."""
+        with self._lock:
+            entry = self._entry(query)
+            cached = entry["results"].get(scope) if entry is not None else None
+            if cached is None:
+                self.misses += 1
+                return None
+            if cached[0] != version:
+                del entry["results"][scope]
+                self.stale += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            return list(cached[1])
+
+    def put_results(self, query, scope, version, documents):
+        with self._lock:
+            self._entry(query, create=True)["results"][scope] = (version, list(documents))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "stale": self.stale,
+                "vector_hits": self.vector_hits,
+                "vector_misses": self.vector_misses,
+            }
+
+
+# Process-wide cache shared by every QA service
+_cache = RetrievalCache()
+
+
+def get_vector(query):
+    return _cache.get_vector(query)
+
+
+def put_vector(query, vector):
+    _cache.put_vector(query, vector)
+
+
+def get_results(query, scope, version):
+    return _cache.get_results(query, scope, version)
+
+
+def put_results(query, scope, version, documents):
+    _cache.put_results(query, scope, version, documents)
+
+
+def stats():
+    return _cache.stats()
@@ -0,0 +1,205 @@
+import logging
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfVectorizer
+import core_module.config as config
+
+logger = logging.getLogger(__name__)
+
+
+def _squared_distances(X, centroids, X_sq=None):
+    # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2, computed for all pairs at once
+    if X_sq is None:
+        X_sq = np.einsum("ij,ij->i", X, X)
+    C_sq = np.einsum("ij,ij->i", centroids, centroids)
+    distances = X_sq[:, None] - 2.0 * (X @ centroids.T) + C_sq[None, :]
+    return np.maximum(distances, 0.0)
+
+
+def _cluster_sums(X, labels, k):
+    # One-hot (k x n) matrix product instead of a Python loop over clusters
+    one_hot = (labels[None, :] == np.arange(k)[:, None]).astype(X.dtype)
+    return one_hot @ X, one_hot.sum(axis=1)
+
+
+def _kmeans_plus_plus(X, k, rng, X_sq):
+    n = X.shape[0]
+    centroids = np.empty((k, X.shape[1]), dtype=X.dtype)
+    centroids[0] = X[rng.integers(n)]
+    closest = _squared_distances(X, centroids[:1], X_sq)[:, 0].astype(np.float64)
+    for i in range(1, k):
+        total = closest.sum()
+        if total <= 0:
+            # Fewer distinct points than clusters; reuse random points
+            centroids[i] = X[rng.integers(n)]
+        else:
+            centroids[i] = X[rng.choice(n, p=closest / total)]
+        closest = np.minimum(closest, _squared_distances(X, centroids[i:i + 1], X_sq)[:, 0])
+    return centroids
+
+
+def kmeans(X, k, seed=None, max_iter=None, tol=None, batch_size=None):
+    """
+    Cluster the rows of X with k-means++ seeding.
+
+    Uses full-batch Lloyd iterations when X fits in one batch and mini-batch
+    updates otherwise. Stops early once the centroids move less than tol
+    (relative to the data variance).
+
+    Returns:
+        tuple: (centroids, labels)
+    """
+    seed = config.SECTION_SELECTOR_SEED if seed is None else seed
+    max_iter = max_iter or config.KMEANS_MAX_ITER
+    tol = config.KMEANS_TOL if tol is None else tol
+    batch_size = batch_size or config.KMEANS_BATCH_SIZE
+
+    X = np.asarray(X, dtype=np.float32)
+    n = X.shape[0]
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    X_sq = np.einsum("ij,ij->i", X, X)
+    threshold = tol * float(np.mean(np.var(X, axis=0)))
+
+    centroids = _kmeans_plus_plus(X, k, rng, X_sq)
+    counts = np.zeros(k, dtype=np.float64)
+    labels = None
+    # Mini-batch shifts never reach zero, so also stop once the smoothed
+    # batch inertia has not improved for a few batches
+    smoothed_inertia = None
+    best_inertia = np.inf
+    no_improvement = 0
+
+    for iteration in range(max_iter):
+        if n <= batch_size:
+            new_labels = np.argmin(_squared_distances(X, centroids, X_sq), axis=1)
+            if labels is not None and np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+            sums, sizes = _cluster_sums(X, labels, k)
+            new_centroids = np.where(sizes[:, None] > 0, sums / np.maximum(sizes, 1)[:, None], centroids)
+        else:
+            batch = rng.choice(n, size=batch_size, replace=False)
+            X_batch = X[batch]
+            batch_distances = _squared_distances(X_batch, centroids, X_sq[batch])
+            batch_labels = np.argmin(batch_distances, axis=1)
+            inertia = float(batch_distances[np.arange(batch_size), batch_labels].mean())
+            alpha = min(1.0, 2.0 * batch_size / n)
+            smoothed_inertia = inertia if smoothed_inertia is None else (1 - alpha) * smoothed_inertia + alpha * inertia
+            if smoothed_inertia < best_inertia:
+                best_inertia = smoothed_inertia
+                no_improvement = 0
+            else:
+                no_improvement += 1
+            sums, sizes = _cluster_sums(X_batch, batch_labels, k)
+            counts += sizes
+            # Per-centroid learning rate decays with the points it has seen
+            rate = np.where(counts > 0, sizes / np.maximum(counts, 1), 0.0)[:, None]
+            batch_means = sums / np.maximum(sizes, 1)[:, None]
+            new_centroids = np.where(sizes[:, None] > 0, (1 - rate) * centroids + rate * batch_means, centroids)
+
+        shift = float(np.sum((new_centroids - centroids) ** 2))
+        centroids = new_centroids.astype(np.float32)
+        if shift <= threshold or no_improvement >= config.KMEANS_PATIENCE:
+            break
+
+    labels = np.argmin(_squared_distances(X, centroids, X_sq), axis=1)
+    logger.info(f"k-means converged after {iteration + 1} iterations (k={k}, n={n})")
+    return centroids, labels
+
+
+def select_representatives(X, num_clusters, seed=None):
+    """Return the indices of the row closest to each centroid, in original order."""
+    X = np.asarray(X, dtype=np.float32)
+    if X.shape[0] == 0:
+        return []
+    centroids, labels = kmeans(X, num_clusters, seed=seed)
+    distances = _squared_distances(X, centroids)
+    selected = set()
+    for cluster in range(centroids.shape[0]):
+        members = np.flatnonzero(labels == cluster)
+        if members.size:
+            selected.add(int(members[np.argmin(distances[members, cluster])]))
+    return sorted(selected)
+
+
+def select_sections(documents, embeddings, num_clusters, seed=None):
+    """
+    Pick one representative chunk per cluster of chunk embeddings.
+
+    Args:
+        documents (list): Chunk Documents in document order
+        embeddings: LangChain Embeddings (the cached client, so repeat runs reuse vectors)
+        num_clusters (int): Number of clusters
+        seed (int, optional): Random seed; defaults to config.SECTION_SELECTOR_SEED
+
+    Returns:
+        list: The selected Documents in original document order
+    """
+    if not documents:
+        return []
+    vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in documents]), dtype=np.float32)
+    return [documents[i] for i in select_representatives(vectors, num_clusters, seed)]
+
+
+def tfidf_vectors(documents, seed=None):
+    """
+    Build a TF-IDF representation of the chunks entirely in-process.
+
+    The sparse TF-IDF matrix is reduced with truncated SVD (LSA) so k-means
+    runs on a small dense matrix; rows are L2-normalised.
+    """
+    seed = config.SECTION_SELECTOR_SEED if seed is None else seed
+    vectorizer = TfidfVectorizer(
+        stop_words="english",
+        sublinear_tf=True,
+        max_features=config.TFIDF_MAX_FEATURES
+    )
+    matrix = vectorizer.fit_transform([doc.page_content for doc in documents])
+    n_components = min(config.TFIDF_SVD_COMPONENTS, matrix.shape[0] - 1, matrix.shape[1] - 1)
+    if n_components < 2:
+        return matrix.toarray().astype(np.float32)
+    reduced = TruncatedSVD(n_components=n_components, random_state=seed).fit_transform(matrix)
+    norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+    return (reduced / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+def select_sections_local(documents, num_clusters, seed=None):
+    """Like select_sections(), but clusters TF-IDF vectors instead of remote embeddings."""
+    if not documents:
+        return []
+    try:
+        vectors = tfidf_vectors(documents, seed)
+    except ValueError:
+        # Empty vocabulary (e.g. only stop words); fall back to evenly spaced chunks
+        step = max(1, len(documents) // max(1, num_clusters))
+        return documents[::step][:num_clusters]
+    return [documents[i] for i in select_representatives(vectors, num_clusters, seed)]
+
+
+def choose_sections(documents, num_clusters, strategy, embeddings=None, seed=None):
+    """Select representative chunks with the "embedding" or "local" strategy."""
+    if strategy == "local":
+        return select_sections_local(documents, num_clusters, seed)
+    return select_sections(documents, embeddings, num_clusters, seed)
+
+
+def compare_strategies(documents, embeddings, num_clusters, seed=None):
+    """
+    Compare the chunks chosen by the embedding and local strategies.
+
+    Returns:
+        dict: Selected indices for both strategies, the Jaccard overlap, and
+              the share of embedding picks matched by a local pick within one chunk
+    """
+    positions = {id(doc): i for i, doc in enumerate(documents)}
+    embedding_picks = {positions[id(doc)] for doc in select_sections(documents, embeddings, num_clusters, seed)}
+    local_picks = {positions[id(doc)] for doc in select_sections_local(documents, num_clusters, seed)}
+    union = embedding_picks | local_picks
+    near = sum(1 for i in embedding_picks if {i - 1, i, i + 1} & local_picks)
+    return {
+        "embedding": sorted(embedding_picks),
+        "local": sorted(local_picks),
+        "jaccard": len(embedding_picks & local_picks) / len(union) if union else 1.0,
+        "near_overlap": near / len(embedding_picks) if embedding_picks else 1.0,
+    }
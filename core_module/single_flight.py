@@ -0,0 +1,137 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """
+    One in-flight computation whose token stream can be read by many requests.
+
+    The producer runs on its own thread and appends chunks to a shared
+    buffer; every reader replays the buffer from the start and then waits
+    for new chunks, so late joiners still receive the whole stream.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._done = False
+        self._cond = threading.Condition()
+        self.error = None
+        self.metadata = {}
+        self.resources = ()
+
+    def _run(self, start, metadata):
+        try:
+            for chunk in start():
+                with self._cond:
+                    self._chunks.append(chunk)
+                    self._cond.notify_all()
+            if metadata is not None:
+                self.metadata = metadata()
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def tokens(self):
+        """Yield every chunk of the stream; re-raises the producer's error at the end."""
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self._chunks) and not self._done:
+                    self._cond.wait()
+                chunks = self._chunks[index:]
+                done = self._done
+            index += len(chunks)
+            yield from chunks
+            if done and index >= len(self._chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+    def result(self):
+        return "".join(self.tokens())
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent computations.
+
+    The first request for a key starts the computation; requests arriving
+    while it runs attach to the same Flight instead of starting their own.
+    The computation runs to completion even if its first requester goes
+    away, so the others (and the result cache) still get its output.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def join(self, key, start, metadata=None, resources=()):
+        """
+        Attach to the flight for key, starting it if none is running.
+
+        Args:
+            key (str): Identity of the computation
+            start (callable): Returns the chunk iterator to run (only called by the leader)
+            metadata (callable, optional): Called after the iterator is exhausted;
+                its result is shared with every request as Flight.metadata
+            resources (tuple, optional): What the computation reads (e.g. stored
+                file hashes), reported by in_use() until it finishes
+
+        Returns:
+            tuple: (Flight, True if this request started it)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.followers += 1
+                return flight, False
+            flight = Flight()
+            flight.resources = tuple(resources)
+            self._flights[key] = flight
+            self.leaders += 1
+
+        def run():
+            try:
+                flight._run(start, metadata)
+            finally:
+                with self._lock:
+                    self._flights.pop(key, None)
+
+        threading.Thread(target=run, name="single-flight", daemon=True).start()
+        return flight, True
+
+    def in_use(self, resource):
+        """Whether a running computation was started with resource among its resources."""
+        with self._lock:
+            return any(resource in flight.resources for flight in self._flights.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "followers": self.followers,
+            }
+
+
+# Process-wide group shared by the summary and report pipelines
+_flights = SingleFlight()
+
+
+def join(key, start, metadata=None, resources=()):
+    return _flights.join(key, start, metadata, resources)
+
+
+def in_use(resource):
+    return _flights.in_use(resource)
+
+
+def stats():
+    return _flights.stats()
@@ -0,0 +1,17 @@
+def chunk_text(chunk):
+    # Extract just the text content from a streamed LLM response chunk
+    if isinstance(chunk, dict) and 'content' in chunk:
+        return chunk['content']
+    elif hasattr(chunk, 'content'):
+        return chunk.content
+    elif isinstance(chunk, str):
+        return chunk
+    return ""
+
+
+def iter_llm_text(llm, prompt):
+    """Yield the text of each chunk from llm.stream() as soon as it arrives."""
+    for chunk in llm.stream(prompt):
+        text = chunk_text(chunk)
+        if text:
+            yield text
@@ -1,81 +1,227 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.document_transformers import EmbeddingsClusteringFilter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.document_loaders import TextLoader, Docx2txtLoader
 import core_module.config as config
-import os
+from core_module import clients
+from core_module import document_cache, result_cache, single_flight
+from core_module.disk_cache import make_key
+from core_module.embedding_cache import get_cached_embeddings
+from core_module.section_selector import choose_sections
+from core_module.streaming import iter_llm_text
+from core_module.markdown_stream import normalize_stream
+from core_module.upload_store import file_sha256
+from concurrent.futures import ThreadPoolExecutor
+
+# Bump whenever the prompts change so cached summaries are regenerated
+SUMMARY_PROMPT_VERSION = 1
+
+MAP_PROMPT = """Summarize the following part of a longer document.
+Keep every key point, finding, number and named concept. Do not add information not found in the text.
+Respond with concise markdown bullet points.
+
+TEXT:
+{text}"""
+
+COMBINE_PROMPT = """The following are summaries of consecutive parts of one document.
+Merge them into a single summary that keeps all key points in order. Do not add new information.
+Respond with concise markdown bullet points.
+
+SUMMARIES:
+{text}"""
+
+REDUCE_PROMPT = """Please summarize the following document. It has been condensed into {count} partial summaries of consecutive parts, given in order.
+Create a comprehensive summary that captures the main points and important details.
+
+INSTRUCTIONS:
+- Do not hallucinate or add information not found in the partial summaries
+- Create appropriate headings and subheadings based on the content
+- Use bullets and new lines to make the summary readable
+
+YOUR RESPONSE MUST BE IN PROPER MARKDOWN FORMAT:
+- Use # for main heading (only one main heading)
+- Use ## and ### for subheadings
+- Use bullet points (- or *) for lists
+- Put a blank line between paragraphs
+- Use bold (**text**) for emphasis
+
+PARTIAL SUMMARIES:
+{sections}"""
+
+
+def _estimate_tokens(text):
+    # Rough token count (about four characters per token)
+    return len(text) // 4
+
+
+def _group_texts(texts, token_budget):
+    # Pack consecutive texts into groups that stay within the token budget
+    groups = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        tokens = _estimate_tokens(text)
+        if current and current_tokens + tokens > token_budget:
+            groups.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append("\n\n".join(current))
+    return groups
 
 
 class DocumentSummarizer:
-    def __init__(self, model_name=None):
+    def __init__(self, model_name=None, selection_strategy=None):
         self.chunk_size = config.CHUNK_SIZE
         self.chunk_overlap = config.CHUNK_OVERLAP
         self.summarize_llm = model_name if model_name in config.AVAILABLE_SUMMARIZER_MODELS else config.SUMMARIZER_MODEL
         self.embed_model = config.EMBED_MODEL
+        self.selection_strategy = selection_strategy if selection_strategy in config.AVAILABLE_SELECTION_STRATEGIES else config.SECTION_SELECTION_STRATEGY
+        self.last_metadata = {}
 
     def extractText(self, file_path):
-        # Detect file type by extension
-        file_extension = file_path.lower().split('.')[-1]
-
-        if file_extension == 'pdf':
-            loader = PyPDFLoader(file_path)
-        elif file_extension == 'docx':
-            loader = Docx2txtLoader(file_path)
-        elif file_extension == 'txt':
-            loader = TextLoader(file_path)
-        else:
-            raise ValueError(f"Unsupported file type: {file_extension}. Supported types are pdf, docx, and txt.")
+        # Parsed pages and chunks are cached by file hash, so the other
+        # features reuse this work for the same document
+        return document_cache.load_chunks(file_path, self.chunk_size, self.chunk_overlap)
+
+    def summarizer(self, file_path, use_cache=True):
+        # Yields the complete, formatted summary once (used by the JSON endpoint)
+        try:
+            # Markdown is normalized while streaming, so joining is all that is left
+            complete_summary = "".join(self.stream_summary(file_path, use_cache))
 
-        pages = loader.load()
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,
-            separators=["\n\n", "\n", " ", ""]
+            # Log completion AFTER all content has been collected
+            print(f"\n[Summarizer] Summarization complete.")
+            
+            yield complete_summary
+            
+            # Return the complete summary
+            return complete_summary
+
+        except Exception as e:
+            error_message = f"Error during summarization: {str(e)}"
+            print(f"[Summarizer] ERROR: {error_message}")
+            yield error_message
+            return error_message
+
+    def stream_summary(self, file_path, use_cache=True):
+        """Yield summary tokens as the LLM produces them; errors are raised to the caller."""
+        # Identical concurrent requests share one pipeline run and its token stream
+        file_hash = file_sha256(file_path)
+        key = make_key("summary", file_hash, self.summarize_llm, self.selection_strategy, use_cache)
+        # The stored file is kept while the run that reads it is in flight
+        flight, leader = single_flight.join(
+            key,
+            lambda: self._generate_summary(file_path, use_cache),
+            lambda: self.last_metadata,
+            resources=(file_hash,)
+        )
+        if not leader:
+            print(f"[Summarizer] Joining in-flight summary generation")
+        yield from flight.tokens()
+        self.last_metadata = {**flight.metadata, "coalesced": not leader}
+
+    def _generate_summary(self, file_path, use_cache):
+        # Everything in the key is known before the document is parsed, so a
+        # cached summary is returned without extracting or chunking anything
+        key = result_cache.result_key(
+            "summary", SUMMARY_PROMPT_VERSION, file_sha256(file_path), self.summarize_llm,
+            self.chunk_size, self.chunk_overlap, self._cache_settings()
         )
-        texts = text_splitter.split_documents(pages)
-        return texts
+        if use_cache:
+            cached = result_cache.get(key)
+            if cached is not None:
+                print(f"[Summarizer] Returning cached summary")
+                self.last_metadata = {**cached["metadata"], "cached": True}
+                yield from result_cache.iter_cached_text(cached["text"])
+                return
 
-    def summarizer(self, file_path):
         # Extract the document
         print(f"[Summarizer] Extracting text from {file_path}")
         texts = self.extractText(file_path)
         doc_length = len(texts)
         print(f"[Summarizer] Document split into {doc_length} chunks")
 
+        params = self._generation_params(doc_length)
+
         # Dynamically adjust parameters based on document length
         dynamic_clusters = min(max(3, doc_length // 5), 10)  # Between 3-10 clusters
         print(f"[Summarizer] Using {dynamic_clusters} clusters for document processing")
 
-        # In the summarizer method, change how you initialize the LLM
-        llm = ChatGoogleGenerativeAI(
-            model=self.summarize_llm,
-            temperature=0.1,
-            top_p=max(0.7, min(0.9, 0.7 + (doc_length / 100) * 0.2)),
-            max_output_tokens=min(4096, max(1024, doc_length * 100)),
-            google_api_key=os.environ.get("GOOGLE_API_KEY")  # Add this line to explicitly use the API key
+        # Shared client per model; sampling parameters are per request
+        llm = clients.get_chat_model(
+            "google",
+            self.summarize_llm,
+            temperature=params["temperature"],
+            top_p=params["top_p"],
+            max_output_tokens=params["max_output_tokens"]
         )
-        embeddings = GoogleGenerativeAIEmbeddings(model=self.embed_model)
+        # The local strategy (and map-reduce) needs no embedding calls at all
+        use_embeddings = self.selection_strategy == "embedding" and doc_length < config.MAP_REDUCE_MIN_CHUNKS
+        embeddings = get_cached_embeddings(self.embed_model) if use_embeddings else None
         print(f"[Summarizer] LLM initialized with model: {self.summarize_llm}")
 
-        # Create the filter with dynamic clusters
-        filter = EmbeddingsClusteringFilter(
-            embeddings=embeddings,
-            num_clusters=min(dynamic_clusters, max(2, len(texts) // 2))  # Ensure at least 2 clusters
-        )
+        num_clusters = min(dynamic_clusters, max(2, len(texts) // 2))  # Ensure at least 2 clusters
 
-        try:
-            # Transform documents using the filter
-            print(f"[Summarizer] Clustering document chunks...")
-            result = filter.transform_documents(documents=texts)
-            print(f"[Summarizer] Clustering complete. Processing {len(result)} sections")
+        if doc_length >= config.MAP_REDUCE_MIN_CHUNKS:
+            # Long documents: summarize section groups in parallel and
+            # reduce the partial summaries instead of one giant prompt
+            print(f"[Summarizer] Long document, using map-reduce summarization")
+            mode = "map-reduce"
+            prompt = self._map_reduce_prompt(texts)
+        else:
+            mode = self.selection_strategy
+            prompt = self._cluster_prompt(texts, num_clusters, embeddings)
+
+        self.last_metadata = {
+            "model_used": self.summarize_llm,
+            "chunks": doc_length,
+            "mode": mode,
+            "params": params,
+            "cached": False,
+        }
+        print(f"[Summarizer] Prompt prepared. Sending to LLM...")
+
+        # Forward tokens as they arrive instead of buffering the whole answer;
+        # markdown is fixed up incrementally on the way through
+        summary_parts = []
+        for token in normalize_stream(iter_llm_text(llm, prompt)):
+            summary_parts.append(token)
+            yield token
 
-            # Prepare prompt for direct streaming
-            if doc_length < 10:
-                # For shorter documents, use a simple prompt
-                prompt = "\n\n".join([doc.page_content for doc in result])
-                prompt = f"""Please summarize the following document:
+        # Only complete generations are cached
+        result_cache.put(key, "".join(summary_parts), self.last_metadata)
+
+    def _cache_settings(self):
+        # Everything besides the model, document and chunking that shapes the
+        # output; the length-based parameters follow from these and the document
+        return {
+            "selection": self.selection_strategy,
+            "seed": config.SECTION_SELECTOR_SEED,
+            "map_reduce_min_chunks": config.MAP_REDUCE_MIN_CHUNKS,
+            "map_reduce_group_tokens": config.MAP_REDUCE_GROUP_TOKENS,
+            "map_reduce_partial_tokens": config.MAP_REDUCE_PARTIAL_TOKENS,
+            "reduce_token_budget": config.REDUCE_TOKEN_BUDGET,
+        }
+
+    def _generation_params(self, doc_length):
+        # Sampling parameters scale with the document length
+        return {
+            "temperature": 0.1,
+            "top_p": max(0.7, min(0.9, 0.7 + (doc_length / 100) * 0.2)),
+            "max_output_tokens": min(4096, max(1024, doc_length * 100)),
+            "map_reduce": doc_length >= config.MAP_REDUCE_MIN_CHUNKS,
+        }
+
+    def _cluster_prompt(self, texts, num_clusters, embeddings):
+        doc_length = len(texts)
+        # Pick the chunk closest to each k-means centroid, in document order
+        print(f"[Summarizer] Clustering document chunks ({self.selection_strategy} selection)...")
+        result = choose_sections(texts, num_clusters, self.selection_strategy, embeddings)
+        print(f"[Summarizer] Clustering complete. Processing {len(result)} sections")
+
+        # Prepare prompt for direct streaming
+        if doc_length < 10:
+            # For shorter documents, use a simple prompt
+            prompt = "\n\n".join([doc.page_content for doc in result])
+            prompt = f"""Please summarize the following document:
 
 {prompt}
 
@@ -84,10 +230,10 @@ FORMAT YOUR RESPONSE WITH CLEAN MARKDOWN:
 - Use bullet points (- or *) for lists
 - Use proper line breaks between paragraphs
 - Use bold (**text**) for emphasis"""
-                print(f"[Summarizer] Using simple prompt for short document")
-            else:
-                # For longer documents, provide more context
-                prompt = f"""Please summarize the following document which has been divided into {len(result)} sections. 
+            print(f"[Summarizer] Using simple prompt for short document")
+        else:
+            # For longer documents, provide more context
+            prompt = f"""Please summarize the following document which has been divided into {len(result)} sections. 
 Create a comprehensive summary that captures the main points and important details.
 
 INSTRUCTIONS:
@@ -109,80 +255,41 @@ YOUR RESPONSE MUST BE IN PROPER MARKDOWN FORMAT:
 
 DOCUMENT SECTIONS:
 """
-                
-                for i, doc in enumerate(result):
-                    prompt += f"\nSection {i + 1}:\n{doc.page_content}\n"
-                print(f"[Summarizer] Using detailed prompt for longer document")
-
-            print(f"[Summarizer] Prompt prepared. Sending to LLM...")
-            
-            # Get all the chunks first in a buffer
-            content_chunks = []
-            # Stream directly from the LLM but just collect chunks
-            for chunk in llm.stream(prompt):
-                # Extract just the text content from the response
-                chunk_text = ""
-                if isinstance(chunk, dict) and 'content' in chunk:
-                    chunk_text = chunk['content']
-                elif hasattr(chunk, 'content'):
-                    chunk_text = chunk.content
-                elif isinstance(chunk, str):
-                    chunk_text = chunk
-
-                # Store the chunk
-                if chunk_text:
-                    content_chunks.append(chunk_text)
-            
-            # Now assemble the full summary with proper markdown
-            complete_summary = "".join(content_chunks)
             
-            # Ensure proper markdown formatting
-            complete_summary = self._fix_markdown_formatting(complete_summary)
-            
-            # Log completion AFTER all content has been collected
-            print(f"\n[Summarizer] Summarization complete.")
-            
-            # Now yield all fixed chunks
-            yield complete_summary
-            
-            # Return the complete summary
-            return complete_summary
+            for i, doc in enumerate(result):
+                prompt += f"\nSection {i + 1}:\n{doc.page_content}\n"
+            print(f"[Summarizer] Using detailed prompt for longer document")
+        return prompt
 
-        except Exception as e:
-            error_message = f"Error during summarization: {str(e)}"
-            print(f"[Summarizer] ERROR: {error_message}")
-            yield error_message
-            return error_message
-    
-    def _fix_markdown_formatting(self, text):
-        """Fix common markdown formatting issues"""
-        lines = text.split('\n')
-        fixed_lines = []
-        
-        # Ensure proper heading format (space after #)
-        for line in lines:
-            if line.strip().startswith('#'):
-                # Count the number of # characters
-                count = 0
-                for char in line:
-                    if char == '#':
-                        count += 1
-                    else:
-                        break
-                
-                # Check if there's a space after the last #
-                if count > 0 and line[count:].strip() and not line[count:].startswith(' '):
-                    line = line[:count] + ' ' + line[count:].strip()
-            
-            fixed_lines.append(line)
-        
-        fixed_text = '\n'.join(fixed_lines)
-        
-        # Ensure blank lines around headings and between paragraphs
-        fixed_text = fixed_text.replace('\n#', '\n\n#')
-        
-        # Remove any excessive blank lines (more than 2 consecutive)
-        while '\n\n\n' in fixed_text:
-            fixed_text = fixed_text.replace('\n\n\n', '\n\n')
-        
-        return fixed_text
\ No newline at end of file
+    def _map_reduce_prompt(self, texts):
+        # Map: summarize groups of consecutive chunks concurrently
+        groups = _group_texts([doc.page_content for doc in texts], config.MAP_REDUCE_GROUP_TOKENS)
+        print(f"[Summarizer] Map phase: {len(groups)} section groups")
+        partials = self._summarize_groups(groups, MAP_PROMPT)
+
+        # Reduce: combine partial summaries level by level until they fit the
+        # final prompt, so wall-clock time grows with tree depth, not length
+        depth = 1
+        while len(partials) > 1 and _estimate_tokens("\n\n".join(partials)) > config.REDUCE_TOKEN_BUDGET:
+            groups = _group_texts(partials, config.REDUCE_TOKEN_BUDGET)
+            if len(groups) == len(partials):
+                # Every partial is too large to pair up under the budget; combine pairwise
+                groups = ["\n\n".join(partials[i:i + 2]) for i in range(0, len(partials), 2)]
+            depth += 1
+            print(f"[Summarizer] Reduce level {depth}: {len(partials)} partial summaries -> {len(groups)}")
+            partials = self._summarize_groups(groups, COMBINE_PROMPT)
+
+        sections = "".join(f"\nPart {i + 1}:\n{partial}\n" for i, partial in enumerate(partials))
+        return REDUCE_PROMPT.format(count=len(partials), sections=sections)
+
+    def _summarize_groups(self, groups, template):
+        llm = clients.get_chat_model(
+            "google",
+            self.summarize_llm,
+            temperature=0.1,
+            max_output_tokens=config.MAP_REDUCE_PARTIAL_TOKENS
+        )
+        with ThreadPoolExecutor(max_workers=config.MAP_REDUCE_MAX_WORKERS) as executor:
+            # map() keeps the partial summaries in document order
+            responses = executor.map(lambda text: llm.invoke(template.format(text=text)), groups)
+            return [response.content for response in responses]
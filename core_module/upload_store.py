@@ -0,0 +1,240 @@
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Every endpoint saves its uploads into this one content-addressed directory.
+# Files are named "<sha256>.<ext>", so the same PDF uploaded any number of
+# times (or to different features) is only stored once.
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+STORE_DIR = os.path.join(project_root, "uploads", "store")
+
+# Read size used while hashing/copying an upload
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Where each endpoint saved uploads before the shared store existed
+LEGACY_UPLOAD_DIRS = [
+    os.path.join(project_root, "uploads", "sum_uploads"),
+    os.path.join(project_root, "api", "uploads", "report_uploads"),
+    os.path.join(current_dir, "documents"),
+]
+LEGACY_EXTENSIONS = ("pdf", "docx", "txt")
+
+
+def file_sha256(file_path):
+    """Return the SHA-256 hex digest of a file on disk."""
+    # Files that already live in the store carry their hash in the name
+    name, _ = os.path.splitext(os.path.basename(file_path))
+    if os.path.dirname(os.path.abspath(file_path)) == STORE_DIR and len(name) == 64:
+        return name
+
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class UploadStore:
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self._lock = threading.Lock()
+        # Requests currently reading each stored file (see save(hold=True))
+        self._holds = Counter()
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    def path_for(self, file_hash, extension="pdf"):
+        return os.path.join(self.store_dir, f"{file_hash}.{extension}")
+
+    def exists(self, file_hash, extension="pdf"):
+        return os.path.exists(self.path_for(file_hash, extension))
+
+    # Save an uploaded file (werkzeug FileStorage or any file-like object)
+    def save(self, file, filename=None, hold=False):
+        """
+        Hash an upload while reading it and store it under its SHA-256.
+
+        Args:
+            file: werkzeug FileStorage or a binary file-like object
+            filename (str, optional): Original filename, used for the extension
+            hold (bool): Keep the stored file from being removed until release()
+
+        Returns:
+            dict: Handle with file_hash, path, filename, original_filename,
+                  size and whether the upload was deduplicated
+        """
+        original_filename = filename or getattr(file, "filename", None) or "upload.pdf"
+        extension = original_filename.rsplit(".", 1)[-1].lower() if "." in original_filename else "pdf"
+        stream = getattr(file, "stream", file)
+
+        # Werkzeug spools uploads into a seekable file, so a known file can be
+        # recognised from a read-only hashing pass without writing anything.
+        if self._seekable(stream):
+            file_hash, size = self._hash_stream(stream)
+            with self._lock:
+                if self.exists(file_hash, extension):
+                    if hold:
+                        self._holds[file_hash] += 1
+                    return self._handle(file_hash, extension, original_filename, size, deduplicated=True)
+            stream.seek(0)
+            file_hash, size, tmp_path = self._copy_to_temp(stream)
+        else:
+            file_hash, size, tmp_path = self._copy_to_temp(stream)
+
+        return self._commit(tmp_path, file_hash, extension, original_filename, size, hold)
+
+    def release(self, file_hash):
+        """End a hold taken by save(hold=True)."""
+        with self._lock:
+            self._holds[file_hash] -= 1
+            if self._holds[file_hash] <= 0:
+                del self._holds[file_hash]
+
+    # Remove a stored file; used when an upload turns out to be unusable
+    def discard(self, file_hash, extension="pdf"):
+        path = self.path_for(file_hash, extension)
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(path)
+                logger.info(f"Removed stored upload {file_hash}")
+                return True
+        return False
+
+    def discard_unreferenced(self, file_hash, referenced, extension="pdf"):
+        """
+        Remove a stored file unless a request holds it or referenced() says it is in use.
+
+        The check and the removal happen under the store lock, so a request
+        that saves the same bytes meanwhile either gets its hold first (and
+        the file stays) or stores a fresh copy.
+
+        Args:
+            file_hash (str): Stored file to remove
+            referenced (callable): Takes the hash; True while anything else
+                (another collection, a background run) still needs the file
+
+        Returns:
+            bool: Whether the file was removed
+        """
+        path = self.path_for(file_hash, extension)
+        with self._lock:
+            if self._holds[file_hash] > 0 or referenced(file_hash) or not os.path.exists(path):
+                return False
+            os.remove(path)
+        logger.info(f"Removed unreferenced upload {file_hash}")
+        return True
+
+    def _commit(self, tmp_path, file_hash, extension, original_filename, size, hold=False):
+        target = self.path_for(file_hash, extension)
+        with self._lock:
+            if hold:
+                self._holds[file_hash] += 1
+            if os.path.exists(target):
+                # Someone stored the same bytes while we were copying
+                os.remove(tmp_path)
+                return self._handle(file_hash, extension, original_filename, size, deduplicated=True)
+            os.replace(tmp_path, target)
+        logger.info(f"Stored new upload {original_filename} as {file_hash}")
+        return self._handle(file_hash, extension, original_filename, size, deduplicated=False)
+
+    def _handle(self, file_hash, extension, original_filename, size, deduplicated):
+        return {
+            "file_hash": file_hash,
+            "path": self.path_for(file_hash, extension),
+            "filename": f"{file_hash}.{extension}",
+            "original_filename": original_filename,
+            "size": size,
+            "deduplicated": deduplicated,
+        }
+
+    def _hash_stream(self, stream):
+        digest = hashlib.sha256()
+        size = 0
+        for block in iter(lambda: stream.read(READ_CHUNK_SIZE), b""):
+            digest.update(block)
+            size += len(block)
+        return digest.hexdigest(), size
+
+    def _copy_to_temp(self, stream):
+        # Hash and write in a single pass; the temp file lives in the store
+        # directory so committing it is an atomic rename.
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.store_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for block in iter(lambda: stream.read(READ_CHUNK_SIZE), b""):
+                    digest.update(block)
+                    out.write(block)
+                    size += len(block)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        return digest.hexdigest(), size, tmp_path
+
+    @staticmethod
+    def _seekable(stream):
+        try:
+            return stream.seekable()
+        except (AttributeError, ValueError):
+            return False
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_upload_store():
+    """Return the process-wide upload store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = UploadStore()
+    return _store
+
+
+def migrate_legacy_uploads(directories=None, remove=False):
+    """
+    One-off import of uploads saved before the content-addressed store.
+
+    Every file is stored under its SHA-256, so the many timestamped copies
+    of the same PDF collapse into one entry.
+
+    Args:
+        directories (list, optional): Directories to import; defaults to LEGACY_UPLOAD_DIRS
+        remove (bool): Delete each original once it is in the store
+
+    Returns:
+        dict: Counts of files stored, deduplicated and removed
+    """
+    store = get_upload_store()
+    counts = {"stored": 0, "deduplicated": 0, "removed": 0}
+    for directory in directories or LEGACY_UPLOAD_DIRS:
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path) or name.rsplit(".", 1)[-1].lower() not in LEGACY_EXTENSIONS:
+                continue
+            with open(path, "rb") as f:
+                handle = store.save(f, name)
+            counts["deduplicated" if handle["deduplicated"] else "stored"] += 1
+            if remove:
+                os.remove(path)
+                counts["removed"] += 1
+    logger.info(f"Migrated legacy uploads: {counts}")
+    return counts
+
+
+if __name__ == "__main__":
+    # "python -m core_module.upload_store [--remove]" imports the legacy
+    # upload directories into the store
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    print(migrate_legacy_uploads(remove="--remove" in sys.argv[1:]))
@@ -0,0 +1,449 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+import numpy as np
+import faiss
+import chromadb
+from langchain_core.documents import Document
+import core_module.config as config
+
+logger = logging.getLogger(__name__)
+
+FAISS_INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+
+
+class ChromaIndex:
+    """
+    Vector index backed by a LangChain Chroma collection.
+
+    Deleted chunks leave holes in the collection's HNSW segment, so once
+    enough have been deleted compact() copies the live chunks into a fresh
+    collection and swaps it in under the original name. The number deleted
+    since the last compaction is kept in the collection's manifest, so it
+    survives restarts.
+    """
+
+    def __init__(self, vector_store, get_manifest):
+        """
+        Args:
+            vector_store (Chroma): LangChain Chroma store of the collection
+            get_manifest (callable): Returns the collection's VectorManifest
+        """
+        self.vector_store = vector_store
+        self.get_manifest = get_manifest
+        self._lock = threading.RLock()
+
+    @property
+    def deleted(self):
+        return self.get_manifest().deleted_chunks
+
+    def add(self, ids, vectors, metadatas, texts):
+        with self._lock:
+            # Upsert so re-ingesting a document replaces its chunks
+            self.vector_store._collection.upsert(ids=ids, embeddings=vectors, metadatas=metadatas, documents=texts)
+
+    def search(self, query_vector, k, doc_ids=None):
+        search_filter = {"doc_id": {"$in": list(doc_ids)}} if doc_ids else None
+        with self._lock:
+            return self.vector_store.similarity_search_by_vector(query_vector, k=k, filter=search_filter)
+
+    def search_batch(self, query_vectors, k, doc_ids=None):
+        """Top-k chunks for each of several query vectors, in one collection query."""
+        search_filter = {"doc_id": {"$in": list(doc_ids)}} if doc_ids else None
+        with self._lock:
+            results = self.vector_store._collection.query(
+                query_embeddings=query_vectors, n_results=k, where=search_filter, include=["documents", "metadatas"]
+            )
+        return [
+            [Document(page_content=text, metadata=metadata or {}) for text, metadata in zip(texts, metadatas)]
+            for texts, metadatas in zip(results["documents"], results["metadatas"])
+        ]
+
+    def get_vectors(self, chunk_ids):
+        """Stored embeddings of chunks by id, None for ids not in the collection."""
+        with self._lock:
+            found = self.vector_store._collection.get(ids=list(chunk_ids), include=["embeddings"])
+        vectors = dict(zip(found["ids"], found["embeddings"]))
+        return [vectors.get(chunk_id) for chunk_id in chunk_ids]
+
+    def count(self):
+        return self.vector_store._collection.count()
+
+    def persist(self):
+        # chromadb writes through to disk on every add
+        pass
+
+    def delete_document(self, doc_id):
+        with self._lock:
+            collection = self.vector_store._collection
+            ids = collection.get(where={"doc_id": doc_id}, include=[])["ids"]
+            if ids:
+                collection.delete(ids=ids)
+                self.get_manifest().record_deleted(len(ids))
+            return len(ids)
+
+    def needs_compaction(self):
+        deleted = self.deleted
+        return (deleted >= config.COMPACTION_MIN_TOMBSTONES
+                and deleted >= config.COMPACTION_TOMBSTONE_RATIO * (self.count() + deleted))
+
+    def compact(self):
+        with self._lock:
+            client = self.vector_store._client
+            old = self.vector_store._collection
+            name = old.name
+            deleted = self.deleted
+            compact_name = f"{name[:54]}_compact"
+            try:
+                # Left behind by a compaction that crashed before the swap
+                client.delete_collection(compact_name)
+                logger.warning(f"Dropped stale collection {compact_name}")
+            except (ValueError, chromadb.errors.NotFoundError):
+                pass
+            fresh = client.create_collection(compact_name, metadata=old.metadata)
+            offset = 0
+            while True:
+                batch = old.get(include=["embeddings", "metadatas", "documents"], limit=1000, offset=offset)
+                if not batch["ids"]:
+                    break
+                fresh.add(ids=batch["ids"], embeddings=batch["embeddings"],
+                          metadatas=batch["metadatas"], documents=batch["documents"])
+                offset += len(batch["ids"])
+            client.delete_collection(name)
+            fresh.modify(name=name)
+            self.vector_store._collection = fresh
+            self.get_manifest().record_deleted(-deleted)
+            logger.info(f"Compacted Chroma collection {name}: {offset} live chunks, {deleted} removed")
+
+
+class FaissIndex:
+    """
+    FAISS vector index with a SQLite chunk store, persisted in one directory.
+
+    The index file is loaded with IO_FLAG_MMAP_IFC, so worker processes
+    that open the same index share its pages through the OS page cache
+    (index types that cannot be memory-mapped are read normally). Readers reload
+    the file when another process has rewritten it.
+
+    index_type:
+        flat  - exact L2 search
+        hnsw  - HNSW graph over full vectors
+        ivfpq - inverted lists with product-quantized codes; the index stays
+                flat (exact) until it holds enough vectors to train
+
+    Deleting a document removes its chunk rows at once (so it is never
+    returned again) and records their ids as tombstones; compact() drops the
+    tombstoned vectors from the index, rebuilding the graph for HNSW.
+    """
+
+    def __init__(self, directory, index_type=None):
+        self.directory = directory
+        self.index_type = index_type or config.FAISS_INDEX_TYPE
+        if self.index_type not in FAISS_INDEX_TYPES:
+            raise ValueError(f"Unsupported FAISS index type: {self.index_type}. Supported types are {', '.join(FAISS_INDEX_TYPES)}.")
+        self.index_path = os.path.join(directory, "index.faiss")
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._index = None
+        self._read_only = False
+        self._mmapped = False
+        self._loaded_mtime = None
+        self._conn = sqlite3.connect(os.path.join(directory, "chunks.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "id INTEGER PRIMARY KEY, chunk_id TEXT UNIQUE NOT NULL, doc_id TEXT, "
+            "text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_doc_id ON chunks (doc_id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tombstones (id INTEGER PRIMARY KEY)")
+        self._conn.commit()
+
+    # Load (or reload after another process rewrote it) the index file
+    def _current_index(self):
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return self._index
+        if self._index is None or mtime != self._loaded_mtime:
+            try:
+                # IO_FLAG_MMAP_IFC maps the vector codes and HNSW graph of
+                # flat/HNSW indexes straight from the file (IO_FLAG_MMAP only
+                # covers inverted lists), so worker processes share the pages
+                self._index = faiss.read_index(self.index_path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+                self._read_only = True
+            except RuntimeError:
+                self._index = faiss.read_index(self.index_path)
+                self._read_only = False
+            self._mmapped = self._read_only and self._is_mapped(self._index)
+            self._loaded_mtime = mtime
+            logger.info(f"Loaded FAISS index {self.index_path} ({self._index.ntotal} vectors, "
+                        f"{'memory-mapped' if self._mmapped else 'in memory'})")
+        return self._index
+
+    @staticmethod
+    def _is_mapped(index):
+        # Mapped storage does not own its code buffer. Keep a reference to
+        # each wrapper while its inner index is in use; it owns the inner one.
+        inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+        storage = faiss.downcast_index(inner.storage) if isinstance(inner, faiss.IndexHNSW) else inner
+        codes = getattr(storage, "codes", None)
+        return codes is not None and hasattr(codes, "is_owned") and not codes.is_owned
+
+    def _new_index(self, dimension):
+        if self.index_type == "hnsw":
+            base = faiss.IndexHNSWFlat(dimension, config.FAISS_HNSW_M)
+            base.hnsw.efConstruction = config.FAISS_HNSW_EF_CONSTRUCTION
+        else:
+            # ivfpq also starts flat until there is enough data to train it
+            base = faiss.IndexFlatL2(dimension)
+        return faiss.IndexIDMap2(base)
+
+    def _is_trained_ivf(self, index):
+        return isinstance(index, faiss.IndexIVFPQ)
+
+    # Indexes loaded with the mmap flags are read-only; writers work on a
+    # private copy
+    def _writable_index(self):
+        index = self._current_index()
+        if index is not None and self._read_only:
+            index = self._index = faiss.read_index(self.index_path)
+            self._read_only = self._mmapped = False
+        return index
+
+    def _maybe_train_ivfpq(self, index):
+        # Swap the exact index for IVF-PQ once there are enough training points
+        if self.index_type != "ivfpq" or self._is_trained_ivf(index) or index.ntotal < config.FAISS_IVF_TRAIN_MIN:
+            return index
+        nlist = min(config.FAISS_IVF_NLIST, index.ntotal // 39)
+        dimension = index.d
+        vectors = index.index.reconstruct_n(0, index.ntotal)
+        ids = faiss.vector_to_array(index.id_map)
+        pq_m = max(m for m in range(1, config.FAISS_PQ_M + 1) if dimension % m == 0)
+        ivf = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, nlist, pq_m, 8)
+        rng = np.random.default_rng(config.SECTION_SELECTOR_SEED)
+        sample = vectors[rng.choice(len(vectors), size=min(len(vectors), nlist * 256), replace=False)]
+        ivf.train(sample)
+        ivf.add_with_ids(vectors, ids)
+        logger.info(f"Trained IVF-PQ index (nlist={nlist}, m={pq_m}) on {len(sample)} vectors")
+        return ivf
+
+    def add(self, ids, vectors, metadatas, texts):
+        with self._lock:
+            known = set()
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT chunk_id FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                known.update(row[0] for row in rows)
+            # Chunk ids are content-addressed, so known ids already hold these vectors
+            new = [i for i, chunk_id in enumerate(ids) if chunk_id not in known]
+            if not new:
+                return
+            # SQLite row ids double as the FAISS ids. They are assigned past
+            # any tombstoned id, since those vectors stay in the index until
+            # compaction. The rows are committed in persist(), together with
+            # the index file, so a crash before then leaves neither behind.
+            last_id = self._conn.execute(
+                "SELECT MAX(COALESCE((SELECT MAX(id) FROM chunks), 0), COALESCE((SELECT MAX(id) FROM tombstones), 0))"
+            ).fetchone()[0]
+            row_ids = {ids[i]: last_id + n for n, i in enumerate(new, 1)}
+            self._conn.executemany(
+                "INSERT INTO chunks (id, chunk_id, doc_id, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                [(row_ids[ids[i]], ids[i], metadatas[i].get("doc_id"), texts[i], json.dumps(metadatas[i], default=str))
+                 for i in new],
+            )
+
+            matrix = np.asarray([vectors[i] for i in new], dtype=np.float32)
+            index = self._writable_index()
+            if index is None:
+                index = self._new_index(matrix.shape[1])
+            index.add_with_ids(matrix, np.asarray([row_ids[ids[i]] for i in new], dtype=np.int64))
+            self._index = self._maybe_train_ivfpq(index)
+
+    def persist(self):
+        with self._lock:
+            if self._index is None:
+                return
+            tmp_path = self.index_path + ".part"
+            faiss.write_index(self._index, tmp_path)
+            os.replace(tmp_path, self.index_path)
+            self._loaded_mtime = os.stat(self.index_path).st_mtime_ns
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def delete_document(self, doc_id):
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO tombstones (id) SELECT id FROM chunks WHERE doc_id = ?", (doc_id,))
+            deleted = self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,)).rowcount
+            self._conn.commit()
+            return deleted
+
+    def tombstones(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tombstones").fetchone()[0]
+
+    def needs_compaction(self):
+        with self._lock:
+            index = self._current_index()
+            tombstones = self.tombstones()
+            return (index is not None and tombstones >= config.COMPACTION_MIN_TOMBSTONES
+                    and tombstones >= config.COMPACTION_TOMBSTONE_RATIO * index.ntotal)
+
+    def compact(self):
+        with self._lock:
+            index = self._current_index()
+            dead = np.asarray([row[0] for row in self._conn.execute("SELECT id FROM tombstones")], dtype=np.int64)
+            if index is None or dead.size == 0:
+                return
+            if self._is_trained_ivf(index):
+                # Inverted lists drop ids in place, which is quick
+                index = self._writable_index()
+                index.remove_ids(faiss.IDSelectorBatch(dead))
+                self._finish_compaction(dead)
+                return
+            # Flat and HNSW indexes are rebuilt from the live vectors; HNSW
+            # graphs cannot drop nodes at all
+            known = faiss.vector_to_array(index.id_map)
+            live = np.setdiff1d(known, dead)
+            vectors = index.reconstruct_batch(live) if live.size else None
+            dimension = index.d
+
+        # Building the graph is the slow part, so searches (and writes) keep
+        # using the current index meanwhile
+        rebuilt = self._new_index(dimension)
+        if live.size:
+            rebuilt.add_with_ids(vectors, live)
+        del vectors
+
+        with self._lock:
+            current = self._current_index()
+            if self._is_trained_ivf(current) or np.setdiff1d(live, faiss.vector_to_array(current.id_map)).size:
+                # Retrained or compacted by another process in the meantime
+                logger.info(f"FAISS index {self.index_path} changed while compacting; retrying on the next pass")
+                return
+            # Carry over vectors added while the new index was being built
+            added = np.setdiff1d(faiss.vector_to_array(current.id_map), known)
+            if added.size:
+                rebuilt.add_with_ids(current.reconstruct_batch(added), added)
+            self._index = self._maybe_train_ivfpq(rebuilt)
+            self._read_only = self._mmapped = False
+            self._finish_compaction(dead)
+
+    def _finish_compaction(self, dead):
+        # Only the tombstones dropped from the index are cleared; documents
+        # deleted during the rebuild wait for the next compaction
+        self._conn.executemany("DELETE FROM tombstones WHERE id = ?", [(int(i),) for i in dead])
+        self.persist()
+        logger.info(f"Compacted FAISS index {self.index_path}: removed {dead.size} vectors, {self._index.ntotal} live")
+
+    def _rows_for_docs(self, doc_ids):
+        doc_ids = list(doc_ids)
+        rows = self._conn.execute(
+            f"SELECT id FROM chunks WHERE doc_id IN ({','.join('?' * len(doc_ids))})", doc_ids
+        ).fetchall()
+        return np.asarray([row[0] for row in rows], dtype=np.int64)
+
+    def search(self, query_vector, k, doc_ids=None):
+        with self._lock:
+            index = self._current_index()
+            if index is None or index.ntotal == 0:
+                return []
+            query = np.asarray([query_vector], dtype=np.float32)
+            if not doc_ids:
+                self._tune(index, k)
+                # Hits on deleted (tombstoned) chunks are dropped when the rows
+                # are looked up, so fetch more until k live chunks are found
+                fetch = k
+                while True:
+                    _, found = index.search(query, min(fetch, index.ntotal))
+                    documents = self._documents([int(i) for i in found[0] if i >= 0])
+                    if len(documents) >= k or fetch >= index.ntotal:
+                        return documents[:k]
+                    fetch *= 4
+            else:
+                allowed = self._rows_for_docs(doc_ids)
+                if allowed.size == 0:
+                    return []
+                if self._is_trained_ivf(index):
+                    params = faiss.SearchParametersIVF(sel=faiss.IDSelectorBatch(allowed), nprobe=config.FAISS_IVF_NPROBE)
+                    _, found = index.search(query, k, params=params)
+                    found = found[0]
+                else:
+                    # Graph search misses most points under a selective filter,
+                    # so score the selected documents' vectors exactly instead
+                    vectors = index.reconstruct_batch(allowed)
+                    distances = np.sum((vectors - query) ** 2, axis=1)
+                    found = allowed[np.argsort(distances)[:k]]
+            return self._documents([int(i) for i in found if i >= 0])
+
+    def search_batch(self, query_vectors, k, doc_ids=None):
+        """Top-k chunks for each row of a query matrix, searched in one call."""
+        with self._lock:
+            index = self._current_index()
+            if index is None or index.ntotal == 0:
+                return [[] for _ in query_vectors]
+            queries = np.asarray(query_vectors, dtype=np.float32)
+            if not doc_ids:
+                self._tune(index, k)
+                _, found = index.search(queries, min(k, index.ntotal))
+                results = [self._documents([int(i) for i in row if i >= 0]) for row in found]
+                # Queries that lost hits to deleted chunks are redone one at a
+                # time with over-fetching
+                return [documents if len(documents) >= min(k, index.ntotal) else self.search(queries[n], k)
+                        for n, documents in enumerate(results)]
+            allowed = self._rows_for_docs(doc_ids)
+            if allowed.size == 0:
+                return [[] for _ in query_vectors]
+            if self._is_trained_ivf(index):
+                params = faiss.SearchParametersIVF(sel=faiss.IDSelectorBatch(allowed), nprobe=config.FAISS_IVF_NPROBE)
+                _, found = index.search(queries, k, params=params)
+            else:
+                # Exact squared distances for every (query, chunk) pair at once
+                vectors = index.reconstruct_batch(allowed)
+                distances = (
+                    np.sum(queries ** 2, axis=1)[:, None]
+                    - 2 * queries @ vectors.T
+                    + np.sum(vectors ** 2, axis=1)[None, :]
+                )
+                found = allowed[np.argsort(distances, axis=1)[:, :k]]
+            return [self._documents([int(i) for i in row if i >= 0]) for row in found]
+
+    def get_vectors(self, chunk_ids):
+        """Stored vectors of chunks by id (IVF-PQ: decoded), None for unknown ids."""
+        with self._lock:
+            index = self._current_index()
+            if index is None or not chunk_ids:
+                return [None] * len(chunk_ids)
+            rows = dict(self._conn.execute(
+                f"SELECT chunk_id, id FROM chunks WHERE chunk_id IN ({','.join('?' * len(chunk_ids))})", list(chunk_ids)
+            ).fetchall())
+            if not rows:
+                return [None] * len(chunk_ids)
+            if self._is_trained_ivf(index) and index.direct_map.type == faiss.DirectMap.NoMap:
+                # Inverted lists need an id -> list position map to reconstruct
+                index.set_direct_map_type(faiss.DirectMap.Hashtable)
+            row_ids = np.asarray(list(rows.values()), dtype=np.int64)
+            vectors = dict(zip(rows, index.reconstruct_batch(row_ids)))
+        return [vectors.get(chunk_id) for chunk_id in chunk_ids]
+
+    def _tune(self, index, k):
+        if self._is_trained_ivf(index):
+            index.nprobe = config.FAISS_IVF_NPROBE
+        elif self.index_type == "hnsw":
+            faiss.downcast_index(index.index).hnsw.efSearch = max(config.FAISS_HNSW_EF_SEARCH, k)
+
+    def _documents(self, row_ids):
+        if not row_ids:
+            return []
+        rows = self._conn.execute(
+            f"SELECT id, text, metadata FROM chunks WHERE id IN ({','.join('?' * len(row_ids))})", row_ids
+        ).fetchall()
+        by_id = {row[0]: Document(page_content=row[1], metadata=json.loads(row[2])) for row in rows}
+        return [by_id[i] for i in row_ids if i in by_id]
@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FORMAT_VERSION = 1
+
+
+class VectorManifest:
+    """
+    JSON record of the documents in a vector store and their chunk counts.
+
+    Kept next to the store and updated on every ingest and delete, so
+    presence checks and counts are in-memory lookups. Workers sharing the
+    store call refresh() to pick up changes written by the others. The version number
+    increases with every change, letting caches detect a modified corpus.
+    It also counts chunks deleted from the store since it was last
+    compacted; that count is bookkeeping and does not bump the version.
+    """
+
+    def __init__(self, path, count_fallback=None):
+        """
+        Args:
+            path (str): Manifest file
+            count_fallback (callable, optional): Returns the store's chunk count;
+                used once to seed the manifest for stores created before it existed
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.version = 0
+        self.documents = {}
+        self.untracked_chunks = 0
+        self.total_chunks = 0
+        self.deleted_chunks = 0
+        self._file_stamp = None
+        self._load(count_fallback)
+
+    def _load(self, count_fallback):
+        try:
+            if self._read():
+                return
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Rebuilding unreadable manifest {self.path}: {str(e)}")
+
+        # Chunks written before the manifest existed are counted but not
+        # attributed to any document
+        self.untracked_chunks = count_fallback() if count_fallback is not None else 0
+        self.total_chunks = self.untracked_chunks
+        logger.info(f"Seeded manifest with {self.untracked_chunks} existing chunks")
+        self._save()
+
+    def _read(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+            stamp = self._stamp(os.fstat(f.fileno()))
+        if data.get("format") != MANIFEST_FORMAT_VERSION:
+            return False
+        version, documents = data["version"], data["documents"]
+        untracked = data.get("untracked_chunks", 0)
+        self.total_chunks = untracked + sum(doc["chunks"] for doc in documents.values())
+        self.version, self.documents, self.untracked_chunks = version, documents, untracked
+        self.deleted_chunks = data.get("deleted_chunks", 0)
+        self._file_stamp = stamp
+        return True
+
+    @staticmethod
+    def _stamp(stat):
+        # Every save replaces the file, so the inode changes even when two
+        # writes land within one mtime tick
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def refresh(self):
+        """Reload the manifest if another process has rewritten it since it was read."""
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        try:
+            if self._stamp(os.stat(self.path)) != self._file_stamp:
+                self._read()
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            # Keep the state read last; the next refresh tries again
+            logger.warning(f"Could not reload manifest {self.path}: {str(e)}")
+
+    def _save(self):
+        data = {
+            "format": MANIFEST_FORMAT_VERSION,
+            "version": self.version,
+            "documents": self.documents,
+            "untracked_chunks": self.untracked_chunks,
+            "deleted_chunks": self.deleted_chunks,
+        }
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            self._file_stamp = self._stamp(os.stat(self.path))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def add_document(self, doc_id, chunks, **info):
+        with self._lock:
+            # Build on the latest file so other workers' changes are kept
+            self._refresh()
+            previous = self.documents.get(doc_id)
+            self.total_chunks += chunks - (previous["chunks"] if previous else 0)
+            self.documents[doc_id] = {"chunks": chunks, "added": time.time(), **info}
+            self.version += 1
+            self._save()
+
+    def remove_document(self, doc_id):
+        with self._lock:
+            self._refresh()
+            removed = self.documents.pop(doc_id, None)
+            if removed is None:
+                return False
+            self.total_chunks -= removed["chunks"]
+            self.version += 1
+            self._save()
+            return True
+
+    def record_deleted(self, chunks):
+        """Add to (or, after compacting, subtract from) the deleted-chunk count."""
+        with self._lock:
+            self._refresh()
+            self.deleted_chunks = max(0, self.deleted_chunks + chunks)
+            self._save()
+
+    def contains(self, doc_id):
+        with self._lock:
+            return doc_id in self.documents
+
+    def list_documents(self):
+        with self._lock:
+            return [{"document_id": doc_id, **info} for doc_id, info in self.documents.items()]
+
+    def has_documents(self):
+        return self.total_chunks > 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "documents": len(self.documents),
+                "chunks": self.total_chunks,
+            }
@@ -0,0 +1,48 @@
+from core_module.bm25 import BM25Index
+
+
+def make_index(tmp_path, texts):
+    index = BM25Index(str(tmp_path / "bm25.sqlite3"))
+    index.add(
+        [f"doc:{i}" for i in range(len(texts))],
+        None,
+        [{"doc_id": "doc", "chunk": i} for i in range(len(texts))],
+        texts,
+    )
+    index.persist()
+    return index
+
+
+def filler(n):
+    return [f"Section {i} discusses measurement results and analysis of the method." for i in range(n)]
+
+
+def test_specific_terms_with_a_clear_winner_are_confident(tmp_path):
+    index = make_index(tmp_path, filler(30) + ["Quantum entanglement fidelity reached ninety percent."])
+
+    documents, confidence = index.search("entanglement fidelity", 4)
+
+    assert documents[0].metadata["chunk"] == 30
+    assert confidence > 0.9
+
+
+def test_common_terms_are_not_confident(tmp_path):
+    # Every chunk has the query terms, so matching all of them says little
+    index = make_index(tmp_path, filler(30))
+
+    documents, confidence = index.search("measurement analysis method", 4)
+
+    assert documents
+    assert confidence < 0.5
+
+
+def test_a_near_tie_is_not_confident(tmp_path):
+    texts = filler(30) + [
+        "Quantum entanglement fidelity reached ninety percent.",
+        "Quantum entanglement fidelity reached eighty percent.",
+    ]
+    index = make_index(tmp_path, texts)
+
+    _, confidence = index.search("entanglement fidelity", 4)
+
+    assert confidence < 0.5
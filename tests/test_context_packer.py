@@ -0,0 +1,48 @@
+from langchain_core.documents import Document
+from core_module.context_packer import estimate_tokens, pack_context
+
+
+def make_chunks(n, doc_id="doc", size=800):
+    # Distinct sentences, one chunk per page so nothing merges
+    return [
+        Document(
+            page_content=" ".join(f"Sentence {i}-{j} of chunk {i} in {doc_id}." for j in range(size // 32)),
+            metadata={"doc_id": doc_id, "page": i, "chunk": i, "start_index": 0},
+        )
+        for i in range(n)
+    ]
+
+
+def test_budget_caps_the_context():
+    chunks = make_chunks(30)
+    budget = 2000
+
+    packed = pack_context(chunks, budget)
+    used = sum(estimate_tokens(doc.page_content) for doc in packed)
+
+    assert used <= budget
+    # Most relevant first
+    assert [doc.metadata["chunk"] for doc in packed] == list(range(len(packed)))
+
+
+def test_context_under_the_budget_is_not_padded():
+    chunks = make_chunks(4)
+
+    packed = pack_context(chunks, 3000)
+
+    assert [doc.page_content for doc in packed] == [doc.page_content for doc in chunks]
+
+
+def test_overlapping_chunks_are_merged_before_packing():
+    text = "".join(f"Line {i} of the only page.\n" for i in range(60))
+    first, second = text[:900], text[700:]
+    chunks = [
+        Document(page_content=first, metadata={"doc_id": "doc", "page": 0, "chunk": 0, "start_index": 0}),
+        Document(page_content=second, metadata={"doc_id": "doc", "page": 0, "chunk": 1, "start_index": 700}),
+    ]
+
+    packed = pack_context(chunks, 3000)
+
+    assert len(packed) == 1
+    assert packed[0].page_content == text.strip()
+    assert packed[0].metadata["chunks"] == [0, 1]
@@ -0,0 +1,68 @@
+import pytest
+from core_module.embedding_dispatcher import EmbeddingDispatcher, FakeEmbeddingBackend
+
+
+class PoisonedBackend(FakeEmbeddingBackend):
+    """Fails every call that contains a poisoned text."""
+
+    def embed_documents(self, texts, **kwargs):
+        if any(text.startswith("poison") for text in texts):
+            with self._lock:
+                self.calls += 1
+            raise RuntimeError("Rejected text")
+        return super().embed_documents(texts, **kwargs)
+
+
+def make_texts(n):
+    return [f"chunk {i}" for i in range(n)]
+
+
+def test_results_keep_input_order():
+    backend = FakeEmbeddingBackend(latency=0.002)
+    dispatcher = EmbeddingDispatcher(backend, batch_size=7, max_in_flight=4)
+    texts = make_texts(200)
+
+    assert dispatcher.embed_documents(texts) == [backend._vector(text) for text in texts]
+
+
+def test_batch_size_grows_while_batches_are_fast():
+    backend = FakeEmbeddingBackend(latency=0.001)
+    dispatcher = EmbeddingDispatcher(backend, batch_size=8, min_batch_size=4, max_batch_size=64,
+                                     max_in_flight=2, target_latency=1.0)
+    dispatcher.embed_documents(make_texts(2000))
+
+    assert 8 < dispatcher.batch_size <= 64
+
+
+def test_batch_size_shrinks_when_batches_are_slow():
+    backend = FakeEmbeddingBackend(latency=0.03)
+    dispatcher = EmbeddingDispatcher(backend, batch_size=32, min_batch_size=4, max_batch_size=64,
+                                     max_in_flight=1, target_latency=0.01)
+    dispatcher.embed_documents(make_texts(200))
+
+    assert dispatcher.batch_size == 4
+
+
+def test_failed_batches_are_retried_one_text_at_a_time():
+    # Batches above the backend's limit fail; their texts are then sent individually
+    backend = FakeEmbeddingBackend(latency=0.001, max_batch_size=10)
+    dispatcher = EmbeddingDispatcher(backend, batch_size=16, min_batch_size=4, max_batch_size=64,
+                                     max_in_flight=2, max_retries=2)
+    texts = make_texts(100)
+
+    assert dispatcher.embed_documents(texts) == [backend._vector(text) for text in texts]
+    stats = dispatcher.stats()
+    assert stats["failed_batches"] >= 1
+    assert stats["retried_texts"] >= 16
+    # Failures halve the batch size; fast batches may grow it again, but
+    # not back to the starting size within one call
+    assert stats["batch_size"] < 16
+
+
+def test_text_that_keeps_failing_raises():
+    backend = PoisonedBackend(latency=0.0)
+    dispatcher = EmbeddingDispatcher(backend, batch_size=8, max_in_flight=2, max_retries=0)
+    texts = make_texts(20) + ["poison"]
+
+    with pytest.raises(RuntimeError, match="Rejected text"):
+        dispatcher.embed_documents(texts)
@@ -0,0 +1,40 @@
+import numpy as np
+from core_module.mmr import mmr, score_relevance
+
+
+def test_pure_relevance_keeps_the_ranking():
+    vectors = np.random.default_rng(0).standard_normal((10, 8))
+    scores = np.linspace(1.0, 0.5, 10)
+
+    assert mmr(None, vectors, 4, lambda_mult=1.0, relevance=score_relevance(scores)) == [0, 1, 2, 3]
+
+
+def test_first_pick_follows_relevance_not_query_similarity():
+    query = [1.0, 0.0]
+    # The second candidate is the closest to the query, but scored lower
+    vectors = [[0.0, 1.0], [1.0, 0.0], [0.7, 0.7]]
+
+    assert mmr(query, vectors, 1)[0] == 1
+    assert mmr(query, vectors, 1, relevance=score_relevance([0.03, 0.02, 0.01]))[0] == 0
+
+
+def test_near_duplicates_are_dropped():
+    vectors = [[1.0, 0.0], [1.0, 0.01], [0.0, 1.0]]
+
+    assert mmr(None, vectors, 2, lambda_mult=0.5, relevance=[1.0, 0.9, 0.8]) == [0, 2]
+
+
+def test_score_gaps_keep_their_proportions():
+    # A near-tie stays a near-tie; a large gap stays large
+    assert np.allclose(score_relevance([0.032, 0.0319, 0.016]), [1.0, 0.996875, 0.5])
+
+    vectors = [[1.0, 0.0], [0.9, 0.44], [0.0, 1.0]]
+    # The runner-up is nearly tied with the top chunk, but the third is far
+    # behind, so diversity does not pull it ahead at this lambda
+    assert mmr(None, vectors, 2, lambda_mult=0.7, relevance=score_relevance([0.032, 0.0319, 0.004])) == [0, 1]
+
+
+def test_candidates_without_vectors_are_similar_to_nothing():
+    vectors = [[1.0, 0.0], [1.0, 0.0], [0.0, 0.0]]
+
+    assert mmr(None, vectors, 3, lambda_mult=0.5, relevance=[1.0, 0.7, 0.4]) == [0, 2, 1]
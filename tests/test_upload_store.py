@@ -0,0 +1,34 @@
+import io
+from core_module.upload_store import UploadStore
+
+
+def test_held_upload_is_kept_until_released(tmp_path):
+    store = UploadStore(str(tmp_path))
+    upload = store.save(io.BytesIO(b"%PDF-1.4 one"), "a.pdf", hold=True)
+
+    assert not store.discard_unreferenced(upload["file_hash"], lambda file_hash: False)
+    assert store.exists(upload["file_hash"])
+
+    store.release(upload["file_hash"])
+    assert store.discard_unreferenced(upload["file_hash"], lambda file_hash: False)
+    assert not store.exists(upload["file_hash"])
+
+
+def test_referenced_upload_is_kept(tmp_path):
+    store = UploadStore(str(tmp_path))
+    upload = store.save(io.BytesIO(b"%PDF-1.4 two"), "b.pdf")
+
+    assert not store.discard_unreferenced(upload["file_hash"], lambda file_hash: True)
+    assert store.exists(upload["file_hash"])
+
+
+def test_deduplicated_save_takes_its_own_hold(tmp_path):
+    store = UploadStore(str(tmp_path))
+    first = store.save(io.BytesIO(b"%PDF-1.4 three"), "c.pdf", hold=True)
+    second = store.save(io.BytesIO(b"%PDF-1.4 three"), "c.pdf", hold=True)
+    assert second["deduplicated"]
+
+    store.release(first["file_hash"])
+    assert not store.discard_unreferenced(first["file_hash"], lambda file_hash: False)
+    store.release(second["file_hash"])
+    assert store.discard_unreferenced(first["file_hash"], lambda file_hash: False)